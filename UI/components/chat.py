@@ -14,7 +14,7 @@ def render_Chat_history():
                 and message["sources"]
             ):
                 with st.expander("📚 Xem nguồn tham khảo"):
-                    for i,source in enumerate(message["source"],1):
+                    for i,source in enumerate(message["sources"],1):
                         st.markdown(f"""
                         <div class="source-box">
                             <b>Nguồn {i}:</b> {source.metadata.get('type', 'unknown')}<br>
@@ -41,7 +41,7 @@ def handle_chat_input(chatbot):
 
     with st.chat_message("assistant"):
         with st.spinner("⏳ Đang suy nghĩ..."):
-            result = chatbot.chat_detailed(prompt)
+            result = chatbot.chat_detailed(prompt, session=st.session_state.chat_session)
             response = result["answer"]
 
             st.markdown(response)
@@ -1,7 +1,30 @@
 import streamlit as st
 
-def render_sidebar(example_questions,hotline,email,website):
+STATE_ICONS = {"ready": "🟢", "loading": "🟡", "pending": "⚪", "failed": "🔴", "disabled": "⚫"}
+
+
+def render_readiness(readiness):
+    if readiness["ready"]:
+        st.success("🟢 Hệ thống sẵn sàng")
+    elif readiness["serving"]:
+        st.info("🟡 Đang tải thêm thành phần, đã có thể trả lời")
+    else:
+        st.warning("🟡 Đang khởi động, câu hỏi đầu tiên có thể chậm")
+    with st.expander("Trạng thái thành phần"):
+        for name, status in readiness["components"].items():
+            line = f"{STATE_ICONS.get(status['state'], '')} {name}: {status['state']}"
+            if status["load_time_ms"] is not None:
+                line += f" ({status['load_time_ms']:.0f} ms)"
+            st.caption(line)
+            if status["error"]:
+                st.caption(f"↳ {status['error']}")
+        st.caption(f"Warm-up: {readiness['warm_up']}")
+
+
+def render_sidebar(example_questions,hotline,email,website,readiness=None):
     st.header("ℹ️ Thông tin hệ thống")
+    if readiness:
+        render_readiness(readiness)
 
     st.markdown("""
     <div class="sidebar-info">
@@ -39,6 +62,7 @@ def render_sidebar(example_questions,hotline,email,website):
     if st.button("🔄 Bắt đầu cuộc trò chuyện mới", type="primary", use_container_width=True):
         st.session_state.messages = []
         st.session_state.total_queries = 0
+        st.session_state.chat_session.reset()
         st.rerun()
 
     st.divider()
@@ -4,7 +4,7 @@ import sys
 import os
 sys.path.append(str(Path(__file__).parent))
 
-from src.RAG_Chatbox import AdmissionChatbot
+from src.RAG_Chatbox import ChatSession, get_chatbot
 from src.utils import format_source, truncate_text
 from config import *
 from UI.components.styles import inject_css
@@ -31,6 +31,15 @@ inject_css()
 # ============================================
 # INITIALIZE CHATBOT
 # ============================================
+@st.cache_resource(show_spinner="⏳ Đang tải mô hình...")
+def load_engine(api_key):
+    """Chatbot dùng chung cho mọi session và mọi lần rerun (model, index chỉ load 1 lần / process)"""
+    chatbot = get_chatbot(api_key=api_key)
+    # model / index load trong thread nền, câu hỏi đến trước khi xong thì chờ thành phần cần dùng
+    chatbot.warm_up(EXAMPLE_QUESTIONS)
+    return chatbot
+
+
 def load_chatbot():
     """Load chatbot (cached)"""
     try:
@@ -40,7 +49,7 @@ def load_chatbot():
             if "GOOGLE_API_KEY" in st.secrets
             else os.getenv("GOOGLE_API_KEY")
             )
-        chatbot = AdmissionChatbot(api_key=api_key)
+        chatbot = load_engine(api_key)
         return chatbot, None
     except Exception as e:
         return None, str(e)
@@ -54,6 +63,9 @@ if "show_sources" not in st.session_state:
     st.session_state.show_sources = False
 if "total_queries" not in st.session_state:
     st.session_state.total_queries = 0
+# lịch sử trò chuyện riêng của session, chatbot dùng chung không giữ trạng thái người dùng
+if "chat_session" not in st.session_state:
+    st.session_state.chat_session = ChatSession()
 
 
 # ============================================
@@ -62,19 +74,17 @@ if "total_queries" not in st.session_state:
 
 render_header(PAGE_ICON, UNIVERSITY_NAME)
 
+chatbot,error = load_chatbot()
+
 # ============================================
 # SIDEBAR
 # ============================================
 render_sidebar(
-    example_questions=[
-        "Ngành Du lịch học những gì?",
-        "Điểm chuẩn ngành Trí tuệ nhân tạo năm 2024?",
-        "Xét tuyển ngành markerting bằng cách nào?",
-        "Học phí khoa học dữ liệu bao nhiêu?"
-    ],
+    example_questions=EXAMPLE_QUESTIONS,
     hotline=ADMISSION_HOTLINE,
     email=ADMISSION_EMAIL,
-    website=UNIVERSITY_WEBSITE
+    website=UNIVERSITY_WEBSITE,
+    readiness=chatbot.readiness() if chatbot else None
 )
 
 
@@ -82,8 +92,6 @@ render_sidebar(
 # MAIN CHAT INTERFACE
 # ============================================
 
-chatbot,error = load_chatbot()
-
 if error:
     st.error(f"""
     ❌ **Không thể khởi tạo chatbot**
@@ -1,7 +1,7 @@
 import os
 from dotenv import load_dotenv
 from pathlib import Path
-import torch
+from functools import lru_cache
 #load environment variables from .env file
 load_dotenv()
 
@@ -9,6 +9,11 @@ load_dotenv()
 BASE_DIR = Path(__file__).resolve().parent
 DATA_DIR = BASE_DIR / "data"
 VECTOR_DB_DIR = BASE_DIR / "university_vector_db"
+ONNX_MODEL_DIR = BASE_DIR / "models" / "onnx"  # model export sang ONNX (backend "onnx")
+# số process đọc + validate file data khi build vector DB, None = số CPU
+DATA_LOAD_WORKERS = None
+# cache vector của các chunk khi build vector DB, None = tắt (embed lại toàn bộ)
+EMBEDDING_CACHE_PATH = BASE_DIR / ".cache" / "embeddings.sqlite"
 
 #----------------------------------------------------
 # Models settings
@@ -16,6 +21,10 @@ VECTOR_DB_DIR = BASE_DIR / "university_vector_db"
 #embedding model
 EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
 EMBEDDING_DEVICE = "cpu"  # or "cuda" for GPU
+# embed câu hỏi lúc truy vấn: "torch" (HuggingFaceEmbeddings) | "onnx" (ONNX Runtime, cần onnxruntime + optimum)
+# index vẫn build bằng model PyTorch, kiểm tra độ khớp: python src/onnx_backend.py embedding
+EMBEDDING_BACKEND = "torch"
+EMBEDDING_ONNX_QUANTIZE = True
 #LLM model settings
 LLM_provider = os.getenv("LLM_PROVIDER", "gemini") 
 LLM_TEMPERATURE = 0.3
@@ -29,7 +38,25 @@ GEMINI_API_KEY = os.getenv("GOOGLE_API_KEY")
 #----------------------------------------------------
 # Vector search settings
 RETRIEVAL_K = 5  # số lượng tài liệu hàng đầu để truy xuất
-SIMILARITY_THRESHOLD = 0.5  # ngưỡng tương tự 
+SIMILARITY_THRESHOLD = 0.5  # ngưỡng tương tự
+# "dense": chỉ FAISS | "hybrid": FAISS + BM25, gộp thứ hạng bằng reciprocal-rank fusion
+RETRIEVAL_MODE = "hybrid"
+RRF_K = 60  # hằng số k của RRF
+# Partition index theo type document (major, faq, cutoff_analysis, admission_method)
+PARTITION_DIR_NAME = "partitions"
+# major_id -> docstore id của document ngành
+MAJOR_INDEX_FILE = "major_index.json"
+# index_version + thông tin build, đổi mỗi khi nội dung index thay đổi
+INDEX_MANIFEST_FILE = "manifest.json"
+# Phân loại câu hỏi cục bộ (nearest-centroid trên embedding) trước khi gọi Gemini
+QUERY_CLASSIFIER_ENABLE = True
+QUERY_CLASSIFIER_THRESHOLD = 0.6  # độ tin cậy tối thiểu để bỏ qua LLM
+QUERY_EXEMPLARS_PATH = DATA_DIR / "query_types" / "query_exemplars.json"
+# Cache loại câu hỏi theo (fingerprint prompt / model, câu hỏi đã chuẩn hóa: chữ thường, giữ dấu, bỏ dấu câu, khoảng trắng thừa)
+QUERY_TYPE_CACHE_SIZE = 2048
+QUERY_TYPE_CACHE_TTL = 3600  # giây, None = không hết hạn
+# cutoff_analytics: ngành có điểm chuẩn cao hơn điểm thí sinh không quá margin -> "sát điểm"
+CUTOFF_BORDERLINE_MARGIN = 1.0
 # Chunking settings
 chunk_size = 500
 chunk_overlap = 100
@@ -51,16 +78,45 @@ enable_source_citation = True  # hiển thị nguồn trích dẫn
 #----------------------------------------------------
 
 RERANKER_MODEL = "BAAI/bge-reranker-base"
-RERANKER_DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
+RERANKER_DEVICE = "auto"  # "auto": cuda nếu có GPU, không thì cpu (xem resolve_device)
 RERANKER_TOP_K = 5
 RERANKER_ENABLE = True
 RERANKER_MAX_LENGTH = 512
 RERANKER_BATCH_SIZE = 32
+# cache điểm CrossEncoder theo (câu hỏi đã chuẩn hóa, doc_id, index_version)
+RERANKER_CACHE_SIZE = 20000
+# "torch": sentence-transformers CrossEncoder | "onnx": ONNX Runtime trên CPU (cần onnxruntime + optimum)
+RERANKER_BACKEND = "torch"
+RERANKER_ONNX_QUANTIZE = True  # quantize int8 động cho backend onnx
+# Bỏ qua rerank khi không đổi được kết quả
+RERANKER_SKIP_MARGIN = 0.15  # cosine top 1 hơn top 2 >= margin -> giữ thứ tự dense
+RERANKER_LATENCY_BUDGET_MS = 200  # giới hạn số candidate theo thời gian chấm ước tính, None = không giới hạn
 #----------------------------------------------------
 # STREAMLIT SETTINGS
 PAGE_TITLE = f"🎓 Tư vấn Tuyển sinh - {UNIVERSITY_NAME}"
 PAGE_ICON = "🎓"
 LAYOUT = "wide"
+# câu hỏi mẫu ở sidebar, cũng dùng để warm-up retriever khi khởi động
+EXAMPLE_QUESTIONS = [
+    "Ngành Du lịch học những gì?",
+    "Điểm chuẩn ngành Trí tuệ nhân tạo năm 2024?",
+    "Xét tuyển ngành markerting bằng cách nào?",
+    "Học phí khoa học dữ liệu bao nhiêu?"
+]
+
+#----------------------------------------------------
+# Device
+#----------------------------------------------------
+@lru_cache(maxsize=None)
+def resolve_device(device: str) -> str:
+    # "auto" -> kiểm tra GPU lúc load model; import torch ở đây để import config không kéo theo torch
+    if device != "auto":
+        return device
+    try:
+        import torch
+        return "cuda" if torch.cuda.is_available() else "cpu"
+    except ImportError:
+        return "cpu"
 
 #----------------------------------------------------
 # Validation settings
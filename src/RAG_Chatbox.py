@@ -1,30 +1,56 @@
 import os
+import threading
 from typing import List, Any, Optional, Dict
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
-from langchain_google_genai import ChatGoogleGenerativeAI
 
 import sys
 from pathlib import Path
 sys.path.append(str(Path(__file__).parent.parent))
 
 from config import (GEMINI_MODEL, GEMINI_API_KEY, LLM_TEMPERATURE, LLM_MAX_TOKENS, UNIVERSITY_NAME,
-                    ADMISSION_EMAIL, ADMISSION_HOTLINE, UNIVERSITY_WEBSITE )
+                    ADMISSION_EMAIL, ADMISSION_HOTLINE, UNIVERSITY_WEBSITE,
+                    enable_chat_history, max_chat_history_length)
 
 from src.retriever import University_Retrieve
 
 from src.utils import format_source
 
+class ChatSession:
+    """
+    Lịch sử trò chuyện của 1 người dùng (1 session Streamlit).
+    Tách khỏi AdmissionChatbot để nhiều session dùng chung 1 chatbot (model, index, Gemini client).
+    """
+    def __init__(self, enable_history: bool = enable_chat_history, max_length: int = max_chat_history_length):
+        self.enable_history = enable_history
+        self.max_length = max_length
+        self.history: List[Dict] = []
+
+    # thêm vào chat history, chỉ giữ max_length tin nhắn gần nhất
+    def add(self, role: str, content: str):
+        if self.enable_history:
+            self.history.append({"role": role, "content": content})
+            if len(self.history) > self.max_length:
+                self.history = self.history[-self.max_length:]
+
+    def reset(self):
+        self.history = []
+
+
 class AdmissionChatbot:
+    """
+    Engine chat dùng chung: retriever (embedding, FAISS, reranker, structured data), Gemini, prompt.
+    Không giữ trạng thái của người dùng, lịch sử nằm trong ChatSession truyền vào từng lần chat.
+    """
     #khởi tạo tham số
-    def __init__(self, vector_db_path: str = None, api_key: str = None, enable_history: bool = True):
+    def __init__(self, vector_db_path: str = None, api_key: str = None, enable_history: bool = enable_chat_history):
         print("🚀 Initializing Admission Chatbot...")
         # Retriever
         self.retriever = University_Retrieve(vector_db_path)
 
         print("🤖 Connecting to Gemini...")
-        # Load LLM
+        # Load LLM (import ở đây: langchain_google_genai import chậm)
+        from langchain_google_genai import ChatGoogleGenerativeAI
         self.llm = ChatGoogleGenerativeAI(model=GEMINI_MODEL,
                                           temperature=LLM_TEMPERATURE,
                                           max_output_tokens=LLM_MAX_TOKENS,
@@ -35,16 +61,14 @@ class AdmissionChatbot:
         # Load prompt
         self.prompt = self._create_prompt_template()
 
-        # RAG chain
+        # RAG chain: nhận {"context", "question"}, retrieval chạy riêng 1 lần qua _retrieve
         self.rag_chain = (
-            {"context": self._retriever_context,"question": RunnablePassthrough()}
-            | self.prompt
+            self.prompt
             | self.llm
             | StrOutputParser()
         )
-        #chat history
-        self.enable_history = enable_history
-        self.history: List[Dict] = []
+        # session mặc định khi không truyền session (CLI / test_chatbot)
+        self.default_session = ChatSession(enable_history=enable_history)
         print("✅ Chatbot ready!\n")
     
     
@@ -99,38 +123,39 @@ class AdmissionChatbot:
                         Trả lời (bằng tiếng Việt, thân thiện, có cấu trúc rõ ràng):"""
         return ChatPromptTemplate.from_messages([("system", system_prompt),("human", human_prompt)])
     
-    # lấy context từ retriever
-    def _retriever_context(self, question:str) -> str:
-        result = self.retriever.hybrid_search(query= question,k=5)
-        return result['context']
-    
-    # thêm vào chat history
-    def _add_to_history(self, role:str, content:str):
-        if self.enable_history:
-            self.history.append({"role":role, "content":content})
+    # retrieval 1 lần / câu hỏi: kết quả dùng cho cả prompt lẫn sources, query_type
+    def _retrieve(self, question: str) -> Dict:
+        return self.retriever.hybrid_search(query= question,k=5)
 
-            if len(self.history) > 20:
-                self.history = self.history[:-20]
+    # input cho rag_chain từ kết quả retrieval
+    def _chain_input(self, question: str, retriever_result: Dict) -> Dict:
+        return {"context": retriever_result['context'], "question": question}
+    
+    # lưu 1 lượt hỏi / đáp vào session
+    def _add_to_history(self, session: Optional[ChatSession], question: str, answer: str):
+        session = session or self.default_session
+        session.add("user", question)
+        session.add("assistant", answer)
     
     # ============================================
     # MAIN CHAT METHODS
     # ============================================
 
     # trả lời câu hỏi đơn giản
-    def simple_chat(self, question: str) -> str:
+    def simple_chat(self, question: str, session: Optional[ChatSession] = None) -> str:
         try:
-            response = self.rag_chain.invoke(question)
+            retriever_result = self._retrieve(question)
+            response = self.rag_chain.invoke(self._chain_input(question, retriever_result))
             
             # lưu vào lịch sử chat
-            self._add_to_history("user", question)
-            self._add_to_history("assistant",response)
+            self._add_to_history(session, question, response)
             return response
         except Exception as e:
             error_message = f"❌ Xin lỗi, có lỗi xảy ra: {str(e)}\n\nVui lòng thử lại hoặc liên hệ {ADMISSION_HOTLINE}"
         return error_message
     
     # chat với thông tin chi tiếc
-    def chat_detailed(self, question: str) -> Dict:
+    def chat_detailed(self, question: str, session: Optional[ChatSession] = None) -> Dict:
         """
         Returns:
             {
@@ -143,10 +168,10 @@ class AdmissionChatbot:
         """
         try:
             #retriever
-            retriever_result = self.retriever.hybrid_search(query=question, k=5)
+            retriever_result = self._retrieve(question)
 
-            # generate response
-            answer = self.rag_chain.invoke(question)
+            # generate response (dùng lại context đã retrieve, không search lại)
+            answer = self.rag_chain.invoke(self._chain_input(question, retriever_result))
             # estimate confidence
             num_sources = len(retriever_result['semantic_results'])
             if num_sources >= 3:
@@ -157,8 +182,7 @@ class AdmissionChatbot:
                 confidence = "Thấp ❌"
 
             # save history
-            self._add_to_history("user",question)
-            self._add_to_history("assistant",answer)
+            self._add_to_history(session, question, answer)
             return{
                 'answer': answer,
                 'sources': retriever_result['semantic_results'],
@@ -177,28 +201,20 @@ class AdmissionChatbot:
             }
     
     # chat với streaming(thể hiện từng từ trong streamlit)
-    def chat_stream(self, question: str):
+    def chat_stream(self, question: str, session: Optional[ChatSession] = None):
 
         try:
             # retriever context
-            context = self._retriever_context(question)
-
-            #create answers
-            messages = self.prompt.format_messages(
-                context = context,
-                question = question
-            )
+            retriever_result = self._retrieve(question)
 
             #stream response
             full_response =""
-            for chunk in self.llm.stream(messages):
-                if hasattr(chunk,'content'):
-                    full_response += chunk.content
-                    yield chunk.content
+            for chunk in self.rag_chain.stream(self._chain_input(question, retriever_result)):
+                full_response += chunk
+                yield chunk
 
             # save history
-            self._add_to_history("user",question)
-            self._add_to_history("assistant",full_response)
+            self._add_to_history(session, question, full_response)
         except Exception as e:
             yield f"❌ Lỗi: {str(e)}"
     # ============================================
@@ -206,13 +222,21 @@ class AdmissionChatbot:
     # ============================================
 
     # xoá chat history
-    def reset_history(self):
-        self.history = []
+    def reset_history(self, session: Optional[ChatSession] = None):
+        (session or self.default_session).reset()
     
     # lấy lịch sử chat
-    def get_history(self) -> List[Dict]:
-        return self.history
+    def get_history(self, session: Optional[ChatSession] = None) -> List[Dict]:
+        return (session or self.default_session).history
     
+    # load model / index trong thread nền và chạy thử các câu hỏi mẫu
+    def warm_up(self, questions: Optional[List[str]] = None, background: bool = True):
+        return self.retriever.warm_up(questions, background=background)
+
+    # trạng thái sẵn sàng của các thành phần retriever
+    def readiness(self) -> Dict:
+        return self.retriever.readiness()
+
     # lấy lời chào đầu tiên
     def get_welcome_message(self)-> str:
         return f"""Xin chào! 👋 Tôi là trợ lý tư vấn tuyển sinh của {UNIVERSITY_NAME}.
@@ -226,11 +250,33 @@ class AdmissionChatbot:
                     Bạn muốn tôi tư vấn về vấn đề gì? 😊"""
 
 
-    # ============================================
-    # TESTING
-    # ============================================
+
+# ============================================
+# SHARED ENGINE
+# ============================================
+_engines: Dict[tuple, AdmissionChatbot] = {}
+_engines_lock = threading.Lock()
+
+
+def get_chatbot(vector_db_path: str = None, api_key: str = None) -> AdmissionChatbot:
+    """
+    Chatbot dùng chung cho cả process (mọi session / rerun / thread), mỗi (vector_db_path, api_key) load 1 lần.
+    Lỗi khi khởi tạo không được lưu lại, lần gọi sau sẽ thử load lại.
+    """
+    key = (vector_db_path, api_key)
+    chatbot = _engines.get(key)
+    if chatbot is None:
+        with _engines_lock:
+            chatbot = _engines.get(key)
+            if chatbot is None:
+                chatbot = AdmissionChatbot(vector_db_path=vector_db_path, api_key=api_key)
+                _engines[key] = chatbot
+    return chatbot
 
 
+# ============================================
+# TESTING
+# ============================================
 def test_chatbot():
     print("\n🧪 Testing Chatbot...\n")
 
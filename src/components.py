@@ -0,0 +1,126 @@
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+PENDING = "pending"
+LOADING = "loading"
+READY = "ready"
+FAILED = "failed"
+DISABLED = "disabled"
+
+
+class Component:
+    """
+    1 tài nguyên nặng (model, index, client) load bằng loader khi cần.
+    - required: load lỗi thì raise cho caller và lần get sau thử load lại
+    - không required: load lỗi thì get trả về None (chạy tiếp không có thành phần này)
+    """
+    def __init__(self, name: str, loader: Callable[[], Any], required: bool = False, enabled: bool = True):
+        self.name = name
+        self.loader = loader
+        self.required = required
+        self.state = PENDING if enabled else DISABLED
+        self.value = None
+        self.error: Optional[str] = None
+        self.load_time = 0.0
+        self.lock = threading.Lock()
+
+    def get(self) -> Any:
+        if self.state in (READY, DISABLED) or (self.state == FAILED and not self.required):
+            return self.value
+        with self.lock:
+            # thread khác có thể đã load xong trong lúc chờ lock
+            if self.state in (READY, DISABLED) or (self.state == FAILED and not self.required):
+                return self.value
+            self.state = LOADING
+            start = time.perf_counter()
+            try:
+                self.value = self.loader()
+                self.error = None
+                self.state = READY
+                print(f"✅ {self.name} ready ({(time.perf_counter() - start) * 1000:.0f} ms)")
+            except Exception as e:
+                self.value = None
+                self.error = str(e)
+                self.state = FAILED
+                print(f"⚠️ Failed to load {self.name}: {e}")
+                if self.required:
+                    raise
+            finally:
+                self.load_time = time.perf_counter() - start
+            return self.value
+
+    def status(self) -> Dict:
+        return {
+            'state': self.state,
+            'required': self.required,
+            'load_time_ms': round(self.load_time * 1000, 1) if self.state in (READY, FAILED) else None,
+            'error': self.error,
+        }
+
+
+class ComponentRegistry:
+    """
+    Danh sách thành phần của retriever, mỗi thành phần load 1 lần (lần dùng đầu tiên hoặc thread warm-up).
+    Trạng thái: pending -> loading -> ready | failed, disabled nếu tắt trong config.
+    """
+    def __init__(self):
+        self._components: Dict[str, Component] = {}
+        self._warm_up_thread: Optional[threading.Thread] = None
+        self.warm_up_state = PENDING
+        self.warm_up_error: Optional[str] = None
+
+    def register(self, name: str, loader: Callable[[], Any], required: bool = False, enabled: bool = True):
+        self._components[name] = Component(name, loader, required=required, enabled=enabled)
+
+    def get(self, name: str) -> Any:
+        return self._components[name].get()
+
+    def state(self, name: str) -> str:
+        return self._components[name].state
+
+    def is_ready(self, names: Optional[Iterable[str]] = None) -> bool:
+        # thành phần required phải ready; thành phần phụ chỉ cần đã thử load (ready / failed / disabled)
+        for name in names or self._components:
+            component = self._components[name]
+            if component.state in (PENDING, LOADING) or (component.required and component.state != READY):
+                return False
+        return True
+
+    def status(self) -> Dict:
+        # serving: đủ thành phần bắt buộc để trả lời; ready: mọi thành phần đã load xong (hoặc lỗi / tắt)
+        required = [name for name, component in self._components.items() if component.required]
+        return {
+            'serving': self.is_ready(required),
+            'ready': self.is_ready(),
+            'warm_up': self.warm_up_state,
+            'warm_up_error': self.warm_up_error,
+            'components': {name: component.status() for name, component in self._components.items()},
+        }
+
+    def warm_up(self, steps: List[Callable[[], Any]], background: bool = True) -> Optional[threading.Thread]:
+        """
+        Chạy các bước warm-up (load thành phần, chạy câu hỏi mẫu) theo thứ tự, mặc định trong thread nền.
+        Gọi nhiều lần chỉ chạy 1 lần.
+        """
+        if self.warm_up_state != PENDING:
+            return self._warm_up_thread
+
+        def run():
+            self.warm_up_state = LOADING
+            try:
+                for step in steps:
+                    step()
+                self.warm_up_state = READY
+            except Exception as e:
+                self.warm_up_error = str(e)
+                self.warm_up_state = FAILED
+                print(f"⚠️ Warm-up failed: {e}")
+
+        if not background:
+            run()
+            return None
+        self.warm_up_state = LOADING
+        self._warm_up_thread = threading.Thread(target=run, name="retriever-warm-up", daemon=True)
+        self._warm_up_thread.start()
+        return self._warm_up_thread
@@ -0,0 +1,86 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, List, Optional, Tuple
+import jsonschema
+
+# ít file hơn ngưỡng này thì load tuần tự, không tốn thời gian khởi động process pool
+PARALLEL_MIN_FILES = 32
+
+# (loại file, đường dẫn, đường dẫn schema hoặc None nếu không validate)
+LoadTask = Tuple[str, Path, Optional[Path]]
+
+
+@dataclass
+class FileLoadResult:
+    kind: str
+    path: Path
+    data: Any = None
+    errors: List[str] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not self.errors
+
+
+@lru_cache(maxsize=None)
+def compiled_validator(schema_path: str):
+    # đọc + kiểm tra schema và dựng validator 1 lần cho mỗi schema (mỗi process)
+    with open(schema_path, "r", encoding="utf-8") as f:
+        schema = json.load(f)
+    validator_cls = jsonschema.validators.validator_for(schema)
+    validator_cls.check_schema(schema)
+    return validator_cls(schema)
+
+
+def validation_errors(validator, data: Any) -> List[str]:
+    # mọi lỗi của file (không dừng ở lỗi đầu tiên), kèm vị trí trong JSON
+    errors = sorted(validator.iter_errors(data), key=lambda e: list(map(str, e.absolute_path)))
+    return [f"{'/'.join(map(str, e.absolute_path)) or '<root>'}: {e.message}" for e in errors]
+
+
+def load_and_validate(task: LoadTask) -> FileLoadResult:
+    kind, path, schema_path = task
+    result = FileLoadResult(kind=kind, path=Path(path))
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            result.data = json.load(f)
+        if schema_path is not None:
+            result.errors = validation_errors(compiled_validator(str(schema_path)), result.data)
+    except Exception as e:
+        result.errors = [f"{type(e).__name__}: {e}"]
+    return result
+
+
+def load_files(tasks: List[LoadTask], max_workers: Optional[int] = None) -> List[FileLoadResult]:
+    """
+    Đọc + validate các file JSON, chia cho process pool khi nhiều file.
+    Kết quả theo đúng thứ tự tasks, lỗi của từng file nằm trong FileLoadResult.errors.
+    """
+    workers = max_workers or os.cpu_count() or 1
+    if workers <= 1 or len(tasks) < PARALLEL_MIN_FILES:
+        return [load_and_validate(task) for task in tasks]
+    chunksize = max(1, len(tasks) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(load_and_validate, tasks, chunksize=chunksize))
+
+
+def format_load_report(results: List[FileLoadResult], root: Optional[Path] = None) -> str:
+    # báo cáo gọn: số file theo loại + lỗi theo từng file
+    counts = {}
+    for result in results:
+        loaded, failed = counts.get(result.kind, (0, 0))
+        counts[result.kind] = (loaded + result.ok, failed + (not result.ok))
+    lines = ["Data load report:"]
+    for kind, (loaded, failed) in counts.items():
+        lines.append(f"  {kind:<10} ✓ {loaded} loaded" + (f", ✗ {failed} failed" if failed else ""))
+    for result in results:
+        if result.ok:
+            continue
+        path = result.path.relative_to(root) if root and result.path.is_relative_to(root) else result.path
+        lines.append(f"  ✗ {path}")
+        lines.extend(f"      - {error}" for error in result.errors)
+    return "\n".join(lines)
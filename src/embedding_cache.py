@@ -0,0 +1,109 @@
+import hashlib
+import sqlite3
+import numpy as np
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from langchain_core.embeddings import Embeddings
+
+# giới hạn số tham số của 1 câu SELECT ... IN (...) trong sqlite
+_SQL_BATCH = 500
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Cache vector embedding trên đĩa (sqlite), khóa = (model, normalize, sha1 nội dung chunk).
+    Vector lưu dạng float32 bytes, dùng lại giữa các lần build vector DB.
+    """
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " model TEXT NOT NULL, normalize INTEGER NOT NULL, text_hash TEXT NOT NULL, vector BLOB NOT NULL,"
+            " PRIMARY KEY (model, normalize, text_hash))"
+        )
+        self._conn.commit()
+
+    def __len__(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def get_many(self, model: str, normalize: bool, hashes: List[str]) -> Dict[str, np.ndarray]:
+        found = {}
+        unique = list(dict.fromkeys(hashes))
+        for start in range(0, len(unique), _SQL_BATCH):
+            batch = unique[start:start + _SQL_BATCH]
+            rows = self._conn.execute(
+                f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND normalize = ? "
+                f"AND text_hash IN ({','.join('?' * len(batch))})",
+                [model, int(normalize), *batch]
+            )
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def put_many(self, model: str, normalize: bool, items: Iterable[Tuple[str, np.ndarray]]):
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO embeddings (model, normalize, text_hash, vector) VALUES (?, ?, ?, ?)",
+            [(model, int(normalize), key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items]
+        )
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Bọc embedding model của builder: embed_documents chỉ embed các chunk chưa có trong cache.
+    - Model chỉ được load (loader) khi có chunk mới / đã sửa, build lại mà dữ liệu không đổi thì không load model
+    - Vector trả về luôn đi qua float32 (giống FAISS) để index giống nhau dù lấy từ cache hay embed mới
+    - embed_query không cache
+    """
+    def __init__(self, model_name: str, normalize: bool, loader: Callable[[], Embeddings], cache_path=None):
+        self.model_name = model_name
+        self.normalize = normalize
+        self._loader = loader
+        self._model: Optional[Embeddings] = None
+        self.cache = EmbeddingCache(cache_path) if cache_path else None
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def model(self) -> Embeddings:
+        if self._model is None:
+            print(f"Loading embedding model {self.model_name}...")
+            self._model = self._loader()
+        return self._model
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        if self.cache is None:
+            self.misses += len(texts)
+            return np.asarray(self.model.embed_documents(texts), dtype=np.float32).tolist()
+        hashes = [text_hash(text) for text in texts]
+        vectors = self.cache.get_many(self.model_name, self.normalize, hashes)
+        self.hits += sum(1 for key in hashes if key in vectors)
+        # chunk trùng nội dung chỉ embed 1 lần
+        missing = {key: text for key, text in zip(hashes, texts) if key not in vectors}
+        if missing:
+            self.misses += len(missing)
+            new_vectors = np.asarray(self.model.embed_documents(list(missing.values())), dtype=np.float32)
+            self.cache.put_many(self.model_name, self.normalize, zip(missing, new_vectors))
+            vectors.update(zip(missing, new_vectors))
+        return [vectors[key].tolist() for key in hashes]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.model.embed_query(text)
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+            'cache_size': len(self.cache) if self.cache is not None else 0,
+        }
@@ -0,0 +1,79 @@
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+from pathlib import Path
+from typing import Dict, List
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+# module của project cần import nhanh (CLI, UI)
+DEFAULT_MODULES = [
+    "config",
+    "src.utils",
+    "src.query_router",
+    "src.structured_index",
+    "src.retriever",
+    "src.RAG_Chatbox",
+    "src.onnx_backend",
+    "src.prepare_vector_db",
+]
+# thư viện nặng, không nên bị kéo theo khi chỉ import module
+HEAVY_MODULES = [
+    "torch", "sentence_transformers", "transformers", "langchain_community", "langchain_huggingface",
+    "langchain_google_genai", "faiss", "onnxruntime", "streamlit",
+]
+
+
+def measure_import(module: str) -> Dict:
+    """
+    Import module trong 1 process mới với python -X importtime.
+    Trả về thời gian import (ms), các thư viện nặng bị import theo và các package tốn thời gian nhất.
+    """
+    probe = (
+        f"import {module}, sys, json; "
+        f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))"
+    )
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [str(BASE_DIR), os.environ.get("PYTHONPATH")]))}
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", probe],
+                          cwd=BASE_DIR, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        return {'module': module, 'error': proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else 'failed'}
+
+    # dòng: "import time: self [us] | cumulative | imported package"
+    total_us, by_package = 0, defaultdict(int)
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = [part.strip() for part in line[len("import time:"):].split("|")]
+        by_package[name.split(".")[0]] += int(self_us)
+        if name == module:
+            total_us = int(cumulative_us)
+    top = sorted(by_package.items(), key=lambda item: item[1], reverse=True)[:3]
+    return {
+        'module': module,
+        'import_ms': round(total_us / 1000, 1),
+        'heavy': json.loads(proc.stdout.strip().splitlines()[-1]),
+        'top_packages': [(name, round(us / 1000, 1)) for name, us in top],
+    }
+
+
+def benchmark_imports(modules: List[str] = None) -> List[Dict]:
+    results = []
+    print(f"{'module':<24} {'import (ms)':>12}  heavy dependencies / top packages (self ms)")
+    for module in modules or DEFAULT_MODULES:
+        result = measure_import(module)
+        results.append(result)
+        if 'error' in result:
+            print(f"{module:<24} {'error':>12}  {result['error']}")
+            continue
+        heavy = ", ".join(result['heavy']) or "-"
+        top = ", ".join(f"{name} {ms}" for name, ms in result['top_packages'])
+        print(f"{module:<24} {result['import_ms']:>12}  {heavy} | {top}")
+    return results
+
+
+if __name__ == "__main__":
+    # python src/import_benchmark.py [module ...]
+    benchmark_imports(sys.argv[1:] or None)
@@ -0,0 +1,130 @@
+import math
+import numpy as np
+from collections import Counter
+from pathlib import Path
+from typing import List, Optional, Tuple
+from langchain_core.documents import Document
+import sys
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from src.utils import tokenize
+
+LEXICAL_INDEX_FILE = "bm25_index.npz"
+
+
+class BM25Index:
+    """
+    Inverted index BM25 trên cùng các chunk với FAISS index tổng.
+    - Dòng i ứng với vị trí i trong FAISS index (giống MetadataStore)
+    - Mỗi từ được index cả dạng gốc lẫn dạng bỏ dấu ('điểm' + 'diem')
+    - Postings lưu dạng CSR: term_offsets[t]..term_offsets[t+1] trong posting_rows / posting_tfs
+    """
+    def __init__(self, doc_ids: List[str], doc_lens: np.ndarray, terms: List[str],
+                 term_offsets: np.ndarray, posting_rows: np.ndarray, posting_tfs: np.ndarray,
+                 k1: float = 1.5, b: float = 0.75):
+        self.doc_ids = list(doc_ids)
+        self.doc_lens = doc_lens.astype(np.float32)
+        self.terms = list(terms)
+        self.term_offsets = term_offsets
+        self.posting_rows = posting_rows
+        self.posting_tfs = posting_tfs
+        self.k1 = k1
+        self.b = b
+        self._term_index = {term: i for i, term in enumerate(self.terms)}
+        avgdl = float(self.doc_lens.mean()) if len(self.doc_lens) else 1.0
+        # mẫu số BM25 phần phụ thuộc độ dài doc, tính 1 lần
+        self._length_norm = k1 * (1 - b + b * self.doc_lens / max(avgdl, 1e-6))
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    # ============================================
+    # BUILD / SAVE / LOAD
+    # ============================================
+    @classmethod
+    def build(cls, documents: List[Document]) -> "BM25Index":
+        # documents phải theo đúng thứ tự đã add vào FAISS index
+        postings = {}
+        doc_lens = []
+        for row, doc in enumerate(documents):
+            counts = Counter(tokenize(doc.page_content))
+            doc_lens.append(sum(counts.values()))
+            for term, tf in counts.items():
+                postings.setdefault(term, []).append((row, tf))
+
+        terms = sorted(postings)
+        offsets = [0]
+        rows, tfs = [], []
+        for term in terms:
+            for row, tf in postings[term]:
+                rows.append(row)
+                tfs.append(tf)
+            offsets.append(len(rows))
+        return cls(
+            doc_ids=[doc.metadata.get('doc_id', '') for doc in documents],
+            doc_lens=np.array(doc_lens, dtype=np.float32),
+            terms=terms,
+            term_offsets=np.array(offsets, dtype=np.int64),
+            posting_rows=np.array(rows, dtype=np.int32),
+            posting_tfs=np.array(tfs, dtype=np.float32),
+        )
+
+    def save(self, folder_path) -> Path:
+        output = Path(folder_path) / LEXICAL_INDEX_FILE
+        np.savez_compressed(
+            output,
+            doc_ids=np.array(self.doc_ids, dtype=str),
+            doc_lens=self.doc_lens,
+            terms=np.array(self.terms, dtype=str),
+            term_offsets=self.term_offsets,
+            posting_rows=self.posting_rows,
+            posting_tfs=self.posting_tfs,
+            params=np.array([self.k1, self.b], dtype=np.float32),
+        )
+        return output
+
+    @classmethod
+    def load(cls, folder_path) -> Optional["BM25Index"]:
+        path = Path(folder_path) / LEXICAL_INDEX_FILE
+        if not path.exists():
+            return None
+        with np.load(path, allow_pickle=False) as data:
+            k1, b = data['params'].tolist()
+            return cls(
+                doc_ids=data['doc_ids'].tolist(),
+                doc_lens=data['doc_lens'],
+                terms=data['terms'].tolist(),
+                term_offsets=data['term_offsets'],
+                posting_rows=data['posting_rows'],
+                posting_tfs=data['posting_tfs'],
+                k1=k1,
+                b=b,
+            )
+
+    # ============================================
+    # SEARCH
+    # ============================================
+    def search(self, query: str, k: int, allowed: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """
+        Trả về [(row, bm25_score)] giảm dần, chỉ các doc có ít nhất 1 từ khớp.
+        allowed: mask bool theo row (vd. từ MetadataStore.mask) để lọc theo metadata
+        """
+        n_docs = len(self.doc_ids)
+        scores = np.zeros(n_docs, dtype=np.float32)
+        for term in set(tokenize(query)):
+            t = self._term_index.get(term)
+            if t is None:
+                continue
+            start, end = self.term_offsets[t], self.term_offsets[t + 1]
+            rows = self.posting_rows[start:end]
+            tfs = self.posting_tfs[start:end]
+            df = end - start
+            idf = math.log(1 + (n_docs - df + 0.5) / (df + 0.5))
+            scores[rows] += idf * tfs * (self.k1 + 1) / (tfs + self._length_norm[rows])
+
+        if allowed is not None:
+            scores[~allowed] = 0
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) == 0:
+            return []
+        top = candidates[np.argsort(-scores[candidates], kind='stable')[:k]]
+        return [(int(row), float(scores[row])) for row in top]
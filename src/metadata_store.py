@@ -0,0 +1,131 @@
+import json
+import numpy as np
+from pathlib import Path
+from typing import List, Dict, Optional
+from langchain_core.documents import Document
+import sys
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from src.utils import find_majors_in_query
+
+METADATA_STORE_FILE = "metadata_store.npz"
+
+
+class MetadataStore:
+    """
+    Bảng metadata dạng cột cho các document trong FAISS index tổng.
+    - Dòng i ứng với vị trí i trong FAISS index (index_to_docstore_id[i])
+    - Mỗi cột trong COLUMNS (type, major_id, school_id, section) lưu mã số nguyên (int32), -1 nếu document không có giá trị
+    - major_incidence[i, j] = True nếu document i liên quan tới ngành major_ids[j]
+    """
+    COLUMNS = ("type", "major_id", "school_id", "section")
+
+    def __init__(self, doc_ids: List[str], codes: Dict[str, np.ndarray], vocabs: Dict[str, List[str]],
+                 major_ids: List[str], major_incidence: np.ndarray):
+        self.doc_ids = list(doc_ids)
+        self.codes = codes
+        self.vocabs = vocabs
+        self.major_ids = list(major_ids)
+        self.major_incidence = major_incidence
+        self._vocab_index = {col: {value: i for i, value in enumerate(values)} for col, values in vocabs.items()}
+        self._major_index = {major_id: i for i, major_id in enumerate(self.major_ids)}
+        self._row_of = {doc_id: i for i, doc_id in enumerate(self.doc_ids)}
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    # ============================================
+    # BUILD / SAVE / LOAD
+    # ============================================
+    @classmethod
+    def build(cls, documents: List[Document], major_mapping: Dict) -> "MetadataStore":
+        # documents phải theo đúng thứ tự đã add vào FAISS index
+        doc_ids = [doc.metadata.get('doc_id', '') for doc in documents]
+        codes, vocabs = {}, {}
+        for col in cls.COLUMNS:
+            values = [doc.metadata.get(col) for doc in documents]
+            vocab = sorted({v for v in values if v})
+            index = {v: i for i, v in enumerate(vocab)}
+            codes[col] = np.array([index.get(v, -1) for v in values], dtype=np.int32)
+            vocabs[col] = vocab
+
+        # Tính trước doc -> ngành (cùng tiêu chí với _enhance_with_major_context)
+        major_ids = list(major_mapping.keys())
+        incidence = np.zeros((len(documents), len(major_ids)), dtype=bool)
+        for i, doc in enumerate(documents):
+            metadata_str = json.dumps(doc.metadata, ensure_ascii=False).lower()
+            mentioned = {m['major_id'] for m in find_majors_in_query(doc.page_content)}
+            for j, major_id in enumerate(major_ids):
+                incidence[i, j] = major_id.lower() in metadata_str or major_id in mentioned
+        return cls(doc_ids, codes, vocabs, major_ids, incidence)
+
+    def save(self, folder_path) -> Path:
+        output = Path(folder_path) / METADATA_STORE_FILE
+        arrays = {
+            'doc_ids': np.array(self.doc_ids, dtype=str),
+            'major_ids': np.array(self.major_ids, dtype=str),
+            # incidence lưu dạng bitmap (8 ngành / byte)
+            'major_incidence': np.packbits(self.major_incidence, axis=1),
+        }
+        for col in self.codes:
+            arrays[f'{col}_codes'] = self.codes[col]
+            arrays[f'{col}_vocab'] = np.array(self.vocabs[col], dtype=str)
+        np.savez_compressed(output, **arrays)
+        return output
+
+    @classmethod
+    def load(cls, folder_path) -> Optional["MetadataStore"]:
+        path = Path(folder_path) / METADATA_STORE_FILE
+        if not path.exists():
+            return None
+        with np.load(path, allow_pickle=False) as data:
+            major_ids = data['major_ids'].tolist()
+            incidence = np.unpackbits(data['major_incidence'], axis=1, count=len(major_ids)).astype(bool)
+            # store cũ có thể thiếu cột mới -> bỏ qua cột đó
+            columns = [col for col in cls.COLUMNS if f'{col}_codes' in data]
+            codes = {col: data[f'{col}_codes'] for col in columns}
+            vocabs = {col: data[f'{col}_vocab'].tolist() for col in columns}
+            return cls(data['doc_ids'].tolist(), codes, vocabs, major_ids, incidence)
+
+    # ============================================
+    # LOOKUP
+    # ============================================
+    def supports(self, filter_dict: Dict) -> bool:
+        return all(key in self.codes for key in filter_dict)
+
+    def rows(self, docs: List[Document]) -> np.ndarray:
+        # vị trí của từng doc trong store, -1 nếu doc không có trong index
+        return np.array([self._row_of.get(doc.metadata.get('doc_id'), -1) for doc in docs], dtype=np.int64)
+
+    def mask(self, filter_dict: Dict, rows: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+        # mask bool cho các dòng khớp filter (AND), None nếu filter có cột không được lưu
+        if not self.supports(filter_dict):
+            return None
+        size = len(self) if rows is None else len(rows)
+        result = np.ones(size, dtype=bool)
+        for col, value in filter_dict.items():
+            code = self._vocab_index[col].get(value, -2)
+            column = self.codes[col] if rows is None else self.codes[col][rows]
+            result &= column == code
+        return result
+
+    def select(self, filter_dict: Dict) -> Optional[np.ndarray]:
+        # vị trí FAISS (int64) của các document khớp filter
+        mask = self.mask(filter_dict)
+        if mask is None:
+            return None
+        return np.flatnonzero(mask).astype(np.int64)
+
+    def id_selector(self, filter_dict: Dict):
+        # faiss.IDSelector để search trực tiếp trên tập con của index tổng
+        positions = self.select(filter_dict)
+        if positions is None:
+            return None, None
+        import faiss
+        return faiss.IDSelectorBatch(positions), positions
+
+    def major_relevance(self, rows: np.ndarray, major_id: str) -> Optional[np.ndarray]:
+        # bool theo từng row: doc có liên quan đến major_id, None nếu ngành không có trong store
+        column = self._major_index.get(major_id)
+        if column is None:
+            return None
+        return self.major_incidence[rows, column]
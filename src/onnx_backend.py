@@ -0,0 +1,275 @@
+import time
+import numpy as np
+from pathlib import Path
+from typing import List, Dict, Union
+from langchain_core.embeddings import Embeddings
+import sys
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from config import ONNX_MODEL_DIR
+
+# ONNX Runtime / optimum là dependency tùy chọn, chỉ import khi dùng backend "onnx"
+ONNX_FILE = "model.onnx"
+ONNX_QUANTIZED_FILE = "model_quantized.onnx"
+
+
+def _model_dir(model_name: str) -> Path:
+    # "BAAI/bge-reranker-base" -> models/onnx/BAAI__bge-reranker-base
+    return Path(ONNX_MODEL_DIR) / model_name.replace('/', '__')
+
+
+def export_onnx_model(model_name: str, task: str, quantize: bool = True) -> Path:
+    """
+    Export model HuggingFace sang ONNX (optimum), quantize int8 động nếu quantize=True.
+    File đã export được dùng lại ở các lần sau. Trả về đường dẫn file .onnx dùng để chạy.
+    task: "text-classification" (cross-encoder) | "feature-extraction" (embedding)
+    """
+    output_dir = _model_dir(model_name)
+    model_path = output_dir / ONNX_FILE
+    quantized_path = output_dir / ONNX_QUANTIZED_FILE
+    target = quantized_path if quantize else model_path
+    if target.exists():
+        return target
+
+    if not model_path.exists():
+        from optimum.onnxruntime import ORTModelForSequenceClassification, ORTModelForFeatureExtraction
+        from transformers import AutoTokenizer
+        model_cls = ORTModelForSequenceClassification if task == "text-classification" else ORTModelForFeatureExtraction
+        print(f"🔄 Exporting {model_name} to ONNX...")
+        model_cls.from_pretrained(model_name, export=True).save_pretrained(output_dir)
+        AutoTokenizer.from_pretrained(model_name).save_pretrained(output_dir)
+
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        print(f"🔄 Quantizing {model_name} (dynamic int8)...")
+        quantize_dynamic(str(model_path), str(quantized_path), weight_type=QuantType.QInt8)
+    return target
+
+
+def _create_session(model_path: Path):
+    import onnxruntime as ort
+    options = ort.SessionOptions()
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return ort.InferenceSession(str(model_path), options, providers=["CPUExecutionProvider"])
+
+
+class OnnxCrossEncoder:
+    """
+    Thay thế sentence_transformers.CrossEncoder bằng ONNX Runtime trên CPU.
+    - predict(pairs, batch_size=...) cùng format với CrossEncoder.predict
+    - Model 1 label: áp sigmoid lên logit giống CrossEncoder mặc định
+    """
+    def __init__(self, model_name: str, max_length: int = 512, quantize: bool = True):
+        from transformers import AutoTokenizer
+        self.model_name = model_name
+        self.max_length = max_length
+        self.model_path = export_onnx_model(model_name, "text-classification", quantize)
+        self.tokenizer = AutoTokenizer.from_pretrained(self.model_path.parent)
+        self.session = _create_session(self.model_path)
+        self._input_names = [i.name for i in self.session.get_inputs()]
+
+    def predict(self, sentences: Union[List[List[str]], List[str]], batch_size: int = 32,
+                show_progress_bar: bool = False, **kwargs) -> Union[np.ndarray, float]:
+        single = isinstance(sentences[0], str)
+        pairs = [sentences] if single else sentences
+        logits = []
+        for start in range(0, len(pairs), batch_size):
+            batch = pairs[start:start + batch_size]
+            features = self.tokenizer(
+                [pair[0] for pair in batch], [pair[1] for pair in batch],
+                padding=True, truncation=True, max_length=self.max_length, return_tensors="np"
+            )
+            inputs = {name: features[name].astype(np.int64) for name in self._input_names if name in features}
+            logits.append(self.session.run(None, inputs)[0])
+        logits = np.concatenate(logits) if logits else np.zeros((0, 1), dtype=np.float32)
+        scores = 1 / (1 + np.exp(-logits[:, 0])) if logits.shape[1] == 1 else logits
+        return scores[0] if single else scores
+
+
+class OnnxEmbeddings(Embeddings):
+    """
+    Embedding câu bằng ONNX Runtime, thay cho HuggingFaceEmbeddings (sentence-transformers) khi encode câu hỏi.
+    Mean pooling theo attention mask + L2 normalize -> cùng không gian vector với FAISS index đã build.
+    """
+    def __init__(self, model_name: str, max_length: int = 256, quantize: bool = True, batch_size: int = 32):
+        from transformers import AutoTokenizer
+        self.model_name = model_name
+        self.max_length = max_length
+        self.batch_size = batch_size
+        self.model_path = export_onnx_model(model_name, "feature-extraction", quantize)
+        self.tokenizer = AutoTokenizer.from_pretrained(self.model_path.parent)
+        self.session = _create_session(self.model_path)
+        self._input_names = [i.name for i in self.session.get_inputs()]
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            features = self.tokenizer(
+                texts[start:start + self.batch_size],
+                padding=True, truncation=True, max_length=self.max_length, return_tensors="np"
+            )
+            inputs = {name: features[name].astype(np.int64) for name in self._input_names if name in features}
+            token_embeddings = self.session.run(None, inputs)[0]
+            mask = features['attention_mask'][..., None].astype(np.float32)
+            pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            vectors.append(pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None))
+        return np.concatenate(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._encode(list(texts)).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._encode([text])[0].tolist()
+
+
+# ============================================
+# BENCHMARK: PyTorch CrossEncoder vs ONNX (fp32 / int8)
+# ============================================
+def _spearman(a: np.ndarray, b: np.ndarray) -> float:
+    if len(a) < 2:
+        return 1.0
+    rank_a = np.argsort(np.argsort(a))
+    rank_b = np.argsort(np.argsort(b))
+    return float(np.corrcoef(rank_a, rank_b)[0, 1])
+
+
+def benchmark_reranker(num_candidates: int = 20, queries_per_type: int = 5) -> Dict[str, Dict]:
+    """
+    So sánh độ chính xác / độ trễ của reranker trên bộ câu hỏi mẫu (data/query_types/query_exemplars.json).
+    Candidate của mỗi câu hỏi lấy từ dense search hiện tại, mốc so sánh là điểm của PyTorch CrossEncoder.
+    """
+    from sentence_transformers import CrossEncoder
+    from config import RERANKER_MODEL, RERANKER_MAX_LENGTH, RERANKER_BATCH_SIZE, RERANKER_TOP_K, QUERY_EXEMPLARS_PATH
+    from src.query_classifier import QueryTypeClassifier
+    from src.retriever import University_Retrieve
+
+    exemplars = QueryTypeClassifier.load_exemplars(QUERY_EXEMPLARS_PATH)
+    queries = [q for examples in exemplars.values() for q in examples[:queries_per_type]]
+    retriever = University_Retrieve()
+    candidates = [[doc.page_content for doc in retriever.search(q, k=num_candidates, mode="dense")] for q in queries]
+
+    backends = {
+        'torch': lambda: CrossEncoder(RERANKER_MODEL, max_length=RERANKER_MAX_LENGTH, device="cpu"),
+        'onnx_fp32': lambda: OnnxCrossEncoder(RERANKER_MODEL, RERANKER_MAX_LENGTH, quantize=False),
+        'onnx_int8': lambda: OnnxCrossEncoder(RERANKER_MODEL, RERANKER_MAX_LENGTH, quantize=True),
+    }
+    scores, latencies = {}, {}
+    for name, factory in backends.items():
+        model = factory()
+        model.predict([[queries[0], candidates[0][0]]])  # warm-up
+        scores[name], latencies[name] = [], []
+        for query, docs in zip(queries, candidates):
+            pairs = [[query, doc] for doc in docs]
+            start = time.perf_counter()
+            result = model.predict(pairs, batch_size=RERANKER_BATCH_SIZE, show_progress_bar=False)
+            latencies[name].append((time.perf_counter() - start) * 1000)
+            scores[name].append(np.asarray(result, dtype=np.float32))
+
+    report = {}
+    for name in backends:
+        spearman, overlap, max_diff = [], [], []
+        for ref, cur in zip(scores['torch'], scores[name]):
+            spearman.append(_spearman(ref, cur))
+            top_ref = set(np.argsort(-ref)[:RERANKER_TOP_K].tolist())
+            top_cur = set(np.argsort(-cur)[:RERANKER_TOP_K].tolist())
+            overlap.append(len(top_ref & top_cur) / max(len(top_ref), 1))
+            max_diff.append(float(np.abs(ref - cur).max()) if len(ref) else 0.0)
+        report[name] = {
+            'latency_ms_mean': float(np.mean(latencies[name])),
+            'latency_ms_p95': float(np.percentile(latencies[name], 95)),
+            'spearman_mean': float(np.mean(spearman)),
+            f'top{RERANKER_TOP_K}_overlap': float(np.mean(overlap)),
+            'max_abs_score_diff': float(np.max(max_diff)),
+        }
+
+    print(f"\n📊 Reranker benchmark: {len(queries)} queries x {num_candidates} candidates")
+    for name, row in report.items():
+        print(f"- {name:10s} " + " | ".join(f"{key}: {value:.3f}" for key, value in row.items()))
+    return report
+
+
+# ============================================
+# PARITY: HuggingFaceEmbeddings vs OnnxEmbeddings
+# ============================================
+def _peak_rss_mb() -> float:
+    # Linux: ru_maxrss tính bằng KB; Windows không có module resource -> 0
+    try:
+        import resource
+    except ImportError:
+        return 0.0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def check_embedding_parity(min_cosine: float = 0.99, k: int = 5) -> Dict[str, Dict]:
+    """
+    Kiểm tra vector câu hỏi từ backend ONNX khớp với model PyTorch đã dùng để build FAISS index.
+    - cosine giữa 2 vector của cùng câu hỏi (min / mean), đạt nếu min >= min_cosine
+    - tỉ lệ trùng top-k khi search FAISS index hiện tại bằng 2 vector
+    - độ trễ embed 1 câu hỏi và mức tăng bộ nhớ (peak RSS) khi load model
+    Backend ONNX được load trước PyTorch để mức tăng RSS không bị lẫn torch.
+    """
+    from config import EMBEDDING_MODEL, VECTOR_DB_DIR, QUERY_EXEMPLARS_PATH
+    from src.query_classifier import QueryTypeClassifier
+
+    queries = [q for examples in QueryTypeClassifier.load_exemplars(QUERY_EXEMPLARS_PATH).values() for q in examples]
+
+    def load_torch():
+        from langchain_huggingface import HuggingFaceEmbeddings
+        return HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL, model_kwargs={"device": "cpu"},
+                                     encode_kwargs={"normalize_embeddings": True})
+
+    backends = {
+        'onnx_int8': lambda: OnnxEmbeddings(EMBEDDING_MODEL, quantize=True),
+        'onnx_fp32': lambda: OnnxEmbeddings(EMBEDDING_MODEL, quantize=False),
+        'torch': load_torch,
+    }
+    vectors, stats = {}, {}
+    for name, factory in backends.items():
+        rss_before = _peak_rss_mb()
+        model = factory()
+        model.embed_query(queries[0])  # warm-up
+        rss_delta = _peak_rss_mb() - rss_before
+        latencies, result = [], []
+        for query in queries:
+            start = time.perf_counter()
+            result.append(model.embed_query(query))
+            latencies.append((time.perf_counter() - start) * 1000)
+        vectors[name] = np.array(result, dtype=np.float32)
+        stats[name] = {'latency_ms_mean': float(np.mean(latencies)), 'latency_ms_p95': float(np.percentile(latencies, 95)),
+                       'peak_rss_increase_mb': rss_delta, 'model': model}
+
+    vector_db = None
+    if Path(VECTOR_DB_DIR).exists():
+        from langchain_community.vectorstores import FAISS
+        vector_db = FAISS.load_local(VECTOR_DB_DIR, stats['torch']['model'], allow_dangerous_deserialization=True)
+
+    def top_ids(vector):
+        docs = vector_db.similarity_search_by_vector(vector.tolist(), k=k)
+        return {doc.metadata.get('doc_id') or doc.page_content for doc in docs}
+
+    report = {}
+    reference = vectors['torch']
+    for name in backends:
+        cosine = (vectors[name] * reference).sum(axis=1)
+        row = {key: value for key, value in stats[name].items() if key != 'model'}
+        row.update({'cosine_min': float(cosine.min()), 'cosine_mean': float(cosine.mean())})
+        if vector_db is not None:
+            overlap = [len(top_ids(v) & top_ids(r)) / k for v, r in zip(vectors[name], reference)]
+            row[f'top{k}_overlap'] = float(np.mean(overlap))
+        row['passed'] = row['cosine_min'] >= min_cosine
+        report[name] = row
+
+    print(f"\n📊 Embedding parity: {len(queries)} queries, model {EMBEDDING_MODEL}")
+    for name, row in report.items():
+        status = "✅" if row['passed'] else "❌"
+        print(f"{status} {name:10s} " + " | ".join(
+            f"{key}: {value:.4f}" for key, value in row.items() if key != 'passed'))
+    return report
+
+
+if __name__ == "__main__":
+    # python src/onnx_backend.py [reranker|embedding]
+    target = sys.argv[1] if len(sys.argv) > 1 else "reranker"
+    if target == "embedding":
+        check_embedding_parity()
+    else:
+        benchmark_reranker()
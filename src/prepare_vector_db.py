@@ -1,22 +1,35 @@
 import json
-import jsonschema
+import shutil
+import hashlib
+from datetime import datetime
 from pathlib import Path
-from typing import List, Dict
+from typing import List, Dict, Optional
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import FAISS
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_core.documents import Document
-
+import sys
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from config import (PARTITION_DIR_NAME, MAJOR_INDEX_FILE, INDEX_MANIFEST_FILE, EMBEDDING_MODEL, EMBEDDING_CACHE_PATH,
+                    DATA_LOAD_WORKERS)
+from src.data_loader import compiled_validator, validation_errors, load_files, format_load_report
+from src.embedding_cache import CachedEmbeddings
+from src.metadata_store import MetadataStore
+from src.structured_store import StructuredStore
+from src.lexical_index import BM25Index
+from src.query_classifier import QueryTypeClassifier
+from src.utils import MAJOR_MAPPING
 
 
 class University_vector_db:
-    def __init__(self, vector_db_path: str, data_path: str):
+    def __init__(self, vector_db_path: str, data_path: str, embedding_cache_path=EMBEDDING_CACHE_PATH):
         self.vector_db_path = Path(vector_db_path)
         self.data_path = Path(data_path)
-        self.embeddings_model = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/all-MiniLM-L6-v2",
-            model_kwargs={"device": "cpu"},
-            encode_kwargs={'normalize_embeddings': True}
+        # chỉ embed chunk mới / đã sửa, model load khi có chunk chưa có trong cache
+        self.embeddings_model = CachedEmbeddings(
+            model_name=EMBEDDING_MODEL,
+            normalize=True,
+            loader=self._load_embedding_model,
+            cache_path=embedding_cache_path
         )
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=500,
@@ -29,20 +42,18 @@ class University_vector_db:
         "admission_methods": []
         }
 
+    def schema_path(self, schema_name: str) -> Path:
+        return self.data_path / "schema" / f"{schema_name}.json"
+
     def load_schema(self, schema_name: str) -> Dict:
-        """Load JSON Schema để validate"""
-        schema_path = self.data_path / "schema" / f"{schema_name}.json"
-        with open(schema_path, "r", encoding="utf-8") as f:
-            return json.load(f)
+        """Load JSON Schema để validate (đọc 1 lần, dùng chung với validator đã compile)"""
+        return compiled_validator(str(self.schema_path(schema_name))).schema
     # """Validate data"""       
-    def validate_document(self, data: Dict, schema: Dict) -> bool:
-       
-        try:
-            jsonschema.validate(instance=data, schema=schema)
-            return True
-        except jsonschema.ValidationError as e:
-            print(f"Validation error: {e.message}")
-            return False
+    def validate_document(self, data: Dict, schema_name: str) -> bool:
+        errors = validation_errors(compiled_validator(str(self.schema_path(schema_name))), data)
+        for error in errors:
+            print(f"Validation error: {error}")
+        return not errors
         
     #"""Load một file JSON"""         
     def load_json_file(self, file_path: Path) -> Dict:
@@ -51,16 +62,69 @@ class University_vector_db:
             return json.load(f)
 
     #"""Tạo Document từ dữ liệu chuyên ngành"""
-    def create_document_from_major(self, major_data: Dict, file_path: Path ) -> Document:
-        
+    def create_document_from_major(self, major_data: Dict, file_path: Path, validate: bool = True) -> List[Document]:
+        """
+        Trả về [document ngành đầy đủ] + các section sub-document
+        (header, description, curriculum, tuition, admission, career) trỏ về document cha qua parent_id
+        validate=False khi file đã được validate lúc load (load_all_data)
+        """
         # Validate dữ liệu với schema
-        schema = self.load_schema("major.schema")
-        if not self.validate_document(major_data, schema):
+        if validate and not self.validate_document(major_data, "major.schema"):
             raise ValueError(f"Invalid major data in {file_path}")
 
+        sections = self.build_major_sections(major_data)
+        content = "\n".join(line for parts in sections.values() for line in parts)
+        
+        # Metadata để filter và retrieve hiệu quả
+        metadata = {
+        'source': str(file_path),
+        'type': 'major',
+        'major_id': major_data.get('major_id', ''),
+        'major_code_ministry': major_data.get('major_code_ministry', ''),
+        'major_name': major_data.get('major_name', ''),
+        'school_id': major_data.get('school_id', ''),
+        'school_name': major_data.get('school_name', ''),
+        'university': major_data.get('university', ''),
+        'language': major_data.get('metadata', {}).get('language', 'vi'),
+        'version': major_data.get('metadata', {}).get('version', '2025'),
+        }
+        
+        docs = [Document(page_content=content, metadata=metadata)]
+        
+        # Section sub-documents: header ngành + nội dung section
+        header = sections['header']
+        for section, parts in sections.items():
+            if not parts:
+                continue
+            section_lines = header if section == 'header' else header + [line.lstrip('\n') for line in parts]
+            docs.append(Document(
+                page_content="\n".join(section_lines),
+                metadata={
+                    'source': str(file_path),
+                    'type': 'major_section',
+                    'section': section,
+                    'parent_id': f"major:{metadata['major_id']}",
+                    'major_id': metadata['major_id'],
+                    'major_name': metadata['major_name'],
+                    'school_id': metadata['school_id'],
+                    'school_name': metadata['school_name'],
+                }
+            ))
+        return docs
+
+    # Tách nội dung ngành thành các section theo thứ tự hiển thị
+    def build_major_sections(self, major_data: Dict) -> Dict[str, List[str]]:
+        sections = {
+            'header': [],
+            'description': [],
+            'curriculum': [],
+            'tuition': [],
+            'admission': [],
+            'career': []
+        }
             
         # Tạo nội dung text để embedding
-        content_parts = [
+        sections['header'] = [
             f"Tên ngành: {major_data.get('major_name', '')}",
             f"Mã ngành: {major_data.get('major_id', '')}",
             f"Mã ngành nội bộ: {major_data.get('major_code_ministry', '')}",
@@ -69,13 +133,15 @@ class University_vector_db:
         ]
     
         # Mô tả chuyên ngành
+        content_parts = sections['description']
         descriptions = major_data['description']
         content_parts.append(f"\nMục tiêu: {descriptions.get('muc_tieu', '')}")
         content_parts.append(f"Vấn đề thực tế: {descriptions.get('van_de_thuc_te', '')}")
         content_parts.append(f"Học gì: {descriptions.get('hoc_gi', '')}")      
 
         
-        # Cơ hội việc làm
+        # Chương trình học
+        content_parts = sections['curriculum']
         if 'curriculum' in major_data:
             curriculum = major_data['curriculum']
             if "mon_dai_cuong" in curriculum:
@@ -98,11 +164,13 @@ class University_vector_db:
                     )
        
         # học phí
+        content_parts = sections['tuition']
         tuition = major_data['tuition']
         content_parts.append(f"\nNhóm học phí: {tuition.get('group_id', '')}")
         content_parts.append(f"Học phí dự kiến: {tuition.get('per_year_estimate', '')}")
         
         # xét tuyển
+        content_parts = sections['admission']
         if 'admission' in major_data:
             admission = major_data['admission']
             
@@ -122,6 +190,7 @@ class University_vector_db:
                 content_parts.append(f"Điều kiện đặc biệt: {dieu_kien_dac_biet_list}")
         
         # công việc sau khi tốt nghiệp
+        content_parts = sections['career']
         if 'career' in major_data:
             career = major_data['career']
             
@@ -145,29 +214,12 @@ class University_vector_db:
                 if 'senior' in salary_list:
                     content_parts.append(f"  • Senior: {salary_list['senior']}")
         
-        content = "\n".join(content_parts)
-        
-        # Metadata để filter và retrieve hiệu quả
-        metadata = {
-        'source': str(file_path),
-        'type': 'major',
-        'major_id': major_data.get('major_id', ''),
-        'major_code_ministry': major_data.get('major_code_ministry', ''),
-        'major_name': major_data.get('major_name', ''),
-        'school_id': major_data.get('school_id', ''),
-        'school_name': major_data.get('school_name', ''),
-        'university': major_data.get('university', ''),
-        'language': major_data.get('metadata', {}).get('language', 'vi'),
-        'version': major_data.get('metadata', {}).get('version', '2025'),
-        }
-        
-        return Document(page_content=content, metadata=metadata)
+        return sections
 
     # Tạo document cho admissions/phuong thuc xet tuyen
-    def create_document_from_Method(self, method_data: Dict, file_path: Path) -> Document:
+    def create_document_from_Method(self, method_data: Dict, file_path: Path, validate: bool = True) -> Document:
          # Validate dữ liệu với schema
-        schema = self.load_schema("admission.schema")
-        if not self.validate_document(method_data, schema):
+        if validate and not self.validate_document(method_data, "admission.schema"):
             raise ValueError(f"Invalid major data in {file_path}")
         methods = method_data['methods']
         doc_list = []
@@ -264,65 +316,146 @@ class University_vector_db:
         return docs
     
     # Tạo structure cho tổ hợp, điểm chuẩn, học phí
-    def load_structure_data(self):
+    def load_structure_data(self, preloaded: Optional[Dict[Path, Dict]] = None):
+        # preloaded: file đã đọc trong load_all_data (điểm chuẩn), không đọc lại
+        preloaded = preloaded or {}
         adm = self.data_path / "admissions"
         self.structured_data["to_hop"] = self.load_json_file(adm / "to_hop_mon.json")
         self.structured_data["admission_methods"] = self.load_json_file(adm / "phuong_thuc_xet_tuyen.json")
         self.structured_data["hoc_phi"] = self.load_json_file(adm / "hoc_phi.json")
         score_major = adm / "diem_chuan_theo_nam"
         for major in score_major.glob("*.json"):   
-            self.structured_data[major.name] = self.load_json_file(major)
+            self.structured_data[major.name] = preloaded[major] if major in preloaded else self.load_json_file(major)
     
-    # lưu structured data       
+    # lưu structured data: JSON để export, bản nhị phân để retriever memory-map
     def save_structured_data(self):
         output = self.vector_db_path / "structured_data.json"
         with open(output, "w", encoding="utf-8") as f:
             json.dump(self.structured_data, f, ensure_ascii=False, indent=2)
+        return StructuredStore.from_data(self.structured_data).save(self.vector_db_path)
     
     # Load all data vào 1 document
     def load_all_data(self) -> list[Document]:
         all_document = []
+        tasks = []
         
         # Load majors
         majors_path = self.data_path / "majors"
         if majors_path.exists():
             for major_category in majors_path.iterdir():
                 if major_category.is_dir():
-                    for major_file in major_category.glob("*.json"):
-                        try: 
-                            major_data = self.load_json_file(major_file)
-                            doc = self.create_document_from_major(major_data, major_file)
-                            all_document.append(doc)
-                            print(f"✓ Loaded major: {major_category.name}/{major_file.name}")
-                        except Exception as e:
-                            print(f"Error processing {major_file}: {e}")
+                    tasks.extend(("major", major_file, self.schema_path("major.schema"))
+                                 for major_file in major_category.glob("*.json"))
         else:
             print(f"Majors path {majors_path} is not a directory.")    
         
         # Load admission methods
         admission_method_path = self.data_path / "admissions" / "phuong_thuc_xet_tuyen.json"
         if admission_method_path.exists():
-            method_data = self.load_json_file(admission_method_path)
-            doc = self.create_document_from_Method(method_data, admission_method_path)
-            all_document.extend(doc)
-            print(f"✓ Loaded method: {admission_method_path.name}")
+            tasks.append(("method", admission_method_path, self.schema_path("admission.schema")))
         
         #load analysis diem 
         analysis_path = self.data_path / "admissions" / "diem_chuan_theo_nam"
         if analysis_path.exists():
-            for analysis_major_path in analysis_path.glob("*.json"):
-                all_document.extend(self.create_cutoff_analysis_docs(self.load_json_file(analysis_major_path), analysis_major_path))
-                print(f"✓ Loaded analysis: {analysis_major_path.name}")
+            tasks.extend(("analysis", path, None) for path in analysis_path.glob("*.json"))
         # load faq
         faq_path = self.data_path / "faq" 
         if faq_path.exists():
-            for faq_major_path in faq_path.glob("*.json"):
-                all_document.extend(self.create_document_from_faq(self.load_json_file(faq_major_path), faq_major_path))
-                print(f"✓ Loaded faq: {faq_major_path.name}")
+            tasks.extend(("faq", path, None) for path in faq_path.glob("*.json"))
+
+        # đọc + validate song song (process pool), tạo document theo đúng thứ tự file như trước
+        self.load_report = load_files(tasks, DATA_LOAD_WORKERS)
+        create_documents = {
+            "major": lambda data, path: self.create_document_from_major(data, path, validate=False),
+            "method": lambda data, path: self.create_document_from_Method(data, path, validate=False),
+            "analysis": self.create_cutoff_analysis_docs,
+            "faq": self.create_document_from_faq,
+        }
+        for result in self.load_report:
+            if not result.ok:
+                continue
+            try:
+                all_document.extend(create_documents[result.kind](result.data, result.path))
+            except Exception as e:
+                result.errors.append(f"{type(e).__name__}: {e}")
+        print(format_load_report(self.load_report, self.data_path))
         # load structure data
-        self.load_structure_data()
+        self.load_structure_data({r.path: r.data for r in self.load_report if r.kind == "analysis" and r.ok})
         return all_document
    
+    # Gán id cố định cho từng document/chunk (dùng chung giữa index tổng và partition)
+    def assign_doc_ids(self, documents: List[Document]) -> List[str]:
+        ids = []
+        counters = {}
+        for doc in documents:
+            doc_type = doc.metadata.get('type', 'other')
+            if doc_type == 'major':
+                doc_id = f"major:{doc.metadata.get('major_id', '')}"
+            elif doc_type == 'major_section':
+                doc_id = f"{doc.metadata.get('parent_id', '')}#{doc.metadata.get('section', '')}"
+            else:
+                key = (doc_type, Path(doc.metadata.get('source', '')).stem)
+                counters[key] = counters.get(key, 0) + 1
+                doc_id = f"{doc_type}:{key[1]}:{counters[key]}"
+            doc.metadata['doc_id'] = doc_id
+            ids.append(doc_id)
+        return ids
+
+    # Lưu mỗi type document thành một FAISS index riêng
+    def save_partitions(self, documents: List[Document], vectors: List[List[float]], ids: List[str]):
+        partition_root = self.vector_db_path / PARTITION_DIR_NAME
+        if partition_root.exists():
+            shutil.rmtree(partition_root)
+        groups = {}
+        for doc, vector, doc_id in zip(documents, vectors, ids):
+            groups.setdefault(doc.metadata.get('type', 'other'), []).append((doc, vector, doc_id))
+        for doc_type, items in groups.items():
+            partition = FAISS.from_embeddings(
+                text_embeddings=[(doc.page_content, vector) for doc, vector, _ in items],
+                embedding=self.embeddings_model,
+                metadatas=[doc.metadata for doc, _, _ in items],
+                ids=[doc_id for _, _, doc_id in items]
+            )
+            partition.save_local(partition_root / doc_type)
+            print(f"- Partition '{doc_type}': {len(items)} docs")
+
+    # Lưu major_id -> docstore id để retriever lấy thẳng document ngành
+    def save_major_index(self, documents: List[Document]) -> Path:
+        major_index = {
+            doc.metadata['major_id']: doc.metadata['doc_id']
+            for doc in documents
+            if doc.metadata.get('type') == 'major' and doc.metadata.get('major_id')
+        }
+        output = self.vector_db_path / MAJOR_INDEX_FILE
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(major_index, f, ensure_ascii=False)
+        return output
+
+    # index_version = hash nội dung các document theo thứ tự trong index (cache phía retriever dựa vào đây)
+    def save_manifest(self, documents: List[Document]) -> Path:
+        digest = hashlib.sha1()
+        for doc in documents:
+            digest.update(doc.metadata.get('doc_id', '').encode('utf-8'))
+            digest.update(doc.page_content.encode('utf-8'))
+        manifest = {
+            'index_version': digest.hexdigest()[:16],
+            'num_documents': len(documents),
+            'embedding_model': self.embeddings_model.model_name,
+            'built_at': datetime.now().isoformat(timespec='seconds')
+        }
+        output = self.vector_db_path / INDEX_MANIFEST_FILE
+        with open(output, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        return output
+
+    def _load_embedding_model(self):
+        from langchain_huggingface import HuggingFaceEmbeddings
+        return HuggingFaceEmbeddings(
+            model_name=EMBEDDING_MODEL,
+            model_kwargs={"device": "cpu"},
+            encode_kwargs={'normalize_embeddings': self.embeddings_model.normalize}
+        )
+
     # Tạo vector db
     def create_vector_db(self):
         print("Loading data and creating vector database...")
@@ -330,10 +463,11 @@ class University_vector_db:
         print(f"Total documents loaded: {len(documents)}")
         
         # ✅ Phân loại documents để chunking khác nhau
-        major_docs = [d for d in documents if d.metadata.get('type') == 'major']
-        other_docs = [d for d in documents if d.metadata.get('type') != 'major']
+        major_types = ('major', 'major_section')
+        major_docs = [d for d in documents if d.metadata.get('type') in major_types]
+        other_docs = [d for d in documents if d.metadata.get('type') not in major_types]
         
-        # Major documents: KHÔNG chunk
+        # Major documents + section: KHÔNG chunk
         # Other documents: Chunk bình thường
         chunked_others = self.text_splitter.split_documents(other_docs)
         
@@ -344,16 +478,49 @@ class University_vector_db:
         print(f"- Other docs (chunked): {len(chunked_others)}")
         print(f"- Total for embedding: {len(all_docs_for_embedding)}")
         
-        vector_db = FAISS.from_documents(
-            documents=all_docs_for_embedding, 
-            embedding=self.embeddings_model
+        # Embed 1 lần, dùng chung cho index tổng và các partition
+        ids = self.assign_doc_ids(all_docs_for_embedding)
+        texts = [d.page_content for d in all_docs_for_embedding]
+        vectors = self.embeddings_model.embed_documents(texts)
+        stats = self.embeddings_model.stats()
+        print(f"- Embedding cache: {stats['hits']} hits, {stats['misses']} misses (embedded)")
+        
+        vector_db = FAISS.from_embeddings(
+            text_embeddings=list(zip(texts, vectors)),
+            embedding=self.embeddings_model,
+            metadatas=[d.metadata for d in all_docs_for_embedding],
+            ids=ids
         )
         
         vector_db.save_local(self.vector_db_path)
         print(f"Vector database saved at {self.vector_db_path}")
         
-        self.save_structured_data()
-        print(f"Structured data saved at {self.vector_db_path / 'structured_data.json'}")
+        self.save_partitions(all_docs_for_embedding, vectors, ids)
+        print(f"Partitions saved at {self.vector_db_path / PARTITION_DIR_NAME}")
+        
+        # Metadata dạng cột theo đúng thứ tự trong index tổng
+        store_path = MetadataStore.build(all_docs_for_embedding, MAJOR_MAPPING).save(self.vector_db_path)
+        print(f"Metadata store saved at {store_path}")
+        
+        lexical_path = BM25Index.build(all_docs_for_embedding).save(self.vector_db_path)
+        print(f"BM25 index saved at {lexical_path}")
+        
+        major_index_path = self.save_major_index(all_docs_for_embedding)
+        print(f"Major index saved at {major_index_path}")
+        
+        # Centroid phân loại câu hỏi, tính bằng cùng embedding model
+        exemplar_path = self.data_path / "query_types" / "query_exemplars.json"
+        if exemplar_path.exists():
+            classifier = QueryTypeClassifier.from_file(exemplar_path, self.embeddings_model, self.embeddings_model.model_name)
+            print(f"Query classifier saved at {classifier.save(self.vector_db_path)}")
+        
+        store_path = self.save_structured_data()
+        print(f"Structured data saved at {self.vector_db_path / 'structured_data.json'} (binary store: {store_path})")
+        
+        print(f"Manifest saved at {self.save_manifest(all_docs_for_embedding)}")
+        stats = self.embeddings_model.stats()
+        print(f"Embedding cache: {stats['hits']} hits, {stats['misses']} misses, "
+              f"hit rate {stats['hit_rate']:.0%}, {stats['cache_size']} vectors cached")
         return vector_db
     
 if __name__ == "__main__":
@@ -0,0 +1,78 @@
+import json
+import numpy as np
+from pathlib import Path
+from typing import List, Dict, Optional, Tuple
+from langchain_core.embeddings import Embeddings
+
+QUERY_CLASSIFIER_FILE = "query_classifier.npz"
+# nhiệt độ softmax trên cosine similarity: nhỏ -> phân biệt mạnh giữa các loại
+SOFTMAX_TEMPERATURE = 0.05
+
+
+class QueryTypeClassifier:
+    """
+    Phân loại câu hỏi cục bộ bằng nearest-centroid trên vector embedding (cùng model với FAISS).
+    - Mỗi loại câu hỏi có 1 centroid = trung bình vector các câu hỏi mẫu (đã normalize)
+    - Độ tin cậy = softmax(cosine / SOFTMAX_TEMPERATURE) của loại gần nhất
+    """
+    def __init__(self, labels: List[str], centroids: np.ndarray, model_name: str = ""):
+        self.labels = list(labels)
+        self.centroids = centroids.astype(np.float32)
+        self.model_name = model_name
+
+    # ============================================
+    # FIT / SAVE / LOAD
+    # ============================================
+    @staticmethod
+    def load_exemplars(exemplar_path) -> Dict[str, List[str]]:
+        # data/query_types/query_exemplars.json -> {query_type: [câu hỏi mẫu]}
+        with open(exemplar_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return {item['query_type']: item['examples'] for item in data.get('data', []) if item.get('examples')}
+
+    @classmethod
+    def fit(cls, exemplars: Dict[str, List[str]], embeddings: Embeddings, model_name: str = "") -> "QueryTypeClassifier":
+        labels = list(exemplars.keys())
+        texts = [text for label in labels for text in exemplars[label]]
+        vectors = np.array(embeddings.embed_documents(texts), dtype=np.float32)
+        centroids, start = [], 0
+        for label in labels:
+            end = start + len(exemplars[label])
+            centroid = vectors[start:end].mean(axis=0)
+            centroids.append(centroid / max(np.linalg.norm(centroid), 1e-12))
+            start = end
+        return cls(labels, np.stack(centroids), model_name)
+
+    @classmethod
+    def from_file(cls, exemplar_path, embeddings: Embeddings, model_name: str = "") -> "QueryTypeClassifier":
+        return cls.fit(cls.load_exemplars(exemplar_path), embeddings, model_name)
+
+    def save(self, folder_path) -> Path:
+        output = Path(folder_path) / QUERY_CLASSIFIER_FILE
+        np.savez(
+            output,
+            labels=np.array(self.labels, dtype=str),
+            centroids=self.centroids,
+            model_name=np.array(self.model_name, dtype=str),
+        )
+        return output
+
+    @classmethod
+    def load(cls, folder_path) -> Optional["QueryTypeClassifier"]:
+        path = Path(folder_path) / QUERY_CLASSIFIER_FILE
+        if not path.exists():
+            return None
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data['labels'].tolist(), data['centroids'], str(data['model_name']))
+
+    # ============================================
+    # PREDICT
+    # ============================================
+    def predict(self, vector) -> Tuple[str, float, Dict[str, float]]:
+        # vector: embedding đã normalize của câu hỏi -> (loại, độ tin cậy, {loại: xác suất})
+        similarities = self.centroids @ np.asarray(vector, dtype=np.float32)
+        logits = (similarities - similarities.max()) / SOFTMAX_TEMPERATURE
+        probs = np.exp(logits)
+        probs /= probs.sum()
+        best = int(np.argmax(probs))
+        return self.labels[best], float(probs[best]), dict(zip(self.labels, probs.tolist()))
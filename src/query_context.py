@@ -0,0 +1,61 @@
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+import sys
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from src.utils import normalize_query, extract_major_from_query, extract_year, extract_combo, extract_user_score
+
+
+@dataclass
+class QueryContext:
+    """
+    Thông tin của 1 câu hỏi, tính 1 lần cho mỗi request và truyền qua các bước của hybrid_search.
+    - normalized: khóa cache (chữ thường, giữ dấu tiếng Việt, bỏ dấu câu)
+    - major_info / year / to_hop: kết quả parse câu hỏi
+    - user_score: điểm của thí sinh nếu câu hỏi có ('22 điểm khối A00 đậu ngành nào?')
+    - embedding: tính lazy khi bước đầu tiên cần vector, các bước sau dùng lại
+    """
+    query: str
+    normalized: str
+    major_info: Optional[Dict] = None
+    year: Optional[int] = None
+    to_hop: Optional[str] = None
+    user_score: Optional[float] = None
+    query_type: Optional[str] = None
+    embed_fn: Optional[Callable[[str], List[float]]] = field(default=None, repr=False)
+    _embedding: Optional[List[float]] = field(default=None, repr=False)
+
+    @classmethod
+    def build(cls, query: str, embed_fn: Optional[Callable[[str], List[float]]] = None) -> "QueryContext":
+        return cls(
+            query=query,
+            normalized=normalize_query(query),
+            major_info=extract_major_from_query(query),
+            year=extract_year(query),
+            to_hop=extract_combo(query),
+            user_score=extract_user_score(query),
+            embed_fn=embed_fn,
+        )
+
+    @property
+    def major_id(self) -> Optional[str]:
+        return self.major_info['major_id'] if self.major_info else None
+
+    @property
+    def embedding(self) -> List[float]:
+        if self._embedding is None:
+            self._embedding = self.embed_fn(self.query)
+        return self._embedding
+
+    @property
+    def score_query(self) -> Dict:
+        # cùng format với parse_score_query
+        major = self.major_info or {}
+        return {
+            'major_id': major.get('major_id'),
+            'major_name': major.get('major_name'),
+            'variants': major.get('variants'),
+            'year': self.year,
+            'to_hop': self.to_hop,
+            'school_id': major.get('school_id')
+        }
@@ -0,0 +1,100 @@
+import re
+import unicodedata
+from pathlib import Path
+from typing import Dict, List, Tuple
+import sys
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from src.utils import fold_accents
+
+# (query_type, priority, weight, keywords)
+# - priority: dùng để phân xử khi 2 loại bằng điểm (cao hơn thắng)
+# - weight: nhân với số từ của keyword khớp -> điểm của loại câu hỏi
+ROUTING_RULES: List[Tuple[str, int, float, List[str]]] = [
+    ("cutoff_analytics", 8, 1.0, ['đậu ngành nào', 'đỗ ngành nào', 'vào ngành nào', 'đậu những ngành nào',
+                                  'đỗ những ngành nào', 'có đậu', 'có đỗ', 'đủ điểm', 'thay đổi thế nào', 'thay đổi ra sao', 'biến động',
+                                  'xu hướng điểm', 'qua các năm', 'so với năm trước', 'điểm trung bình',
+                                  'cao nhất', 'thấp nhất']),
+    ("cutoff_scores", 7, 1.0, ['điểm', 'điểm chuẩn', 'điểm đầu vào', 'điểm trúng tuyển', 'điểm sàn', 'điểm thi']),
+    ("subject_combinations", 6, 1.0, ['tổ hợp', 'tổ hợp môn', 'môn thi', 'khối thi', 'thi môn gì', 'thi khối gì']),
+    ("tuition", 5, 1.0, ['tiền', 'phí', 'học phí', 'mức phí', 'chi phí', 'tiền học']),
+    ("career", 4, 1.0, ['làm gì', 'ra trường', 'nghề nghiệp', 'việc làm', 'cơ hội việc làm', 'vị trí công việc', 'mức lương']),
+    ("curriculum_major", 3, 1.0, ['học gì', 'học những gì', 'học những môn', 'môn gì', 'môn học', 'chương trình',
+                                  'chương trình đào tạo', 'curriculum']),
+    ("admission_methods", 2, 1.0, ['phương thức', 'xét tuyển', 'tuyển sinh', 'đăng ký', 'xét học bạ']),
+    ("major_info", 1, 0.5, ['ngành', 'chuyên ngành', 'major', 'giới thiệu ngành']),
+    ("faq", 0, 0.5, ['khó', 'ký túc xá']),
+]
+# mã tổ hợp (A00, D01...) tính là 1 keyword của subject_combinations
+COMBO_CODE_PATTERN = r'[abcdhv]\d{2}'
+# loại về nhì đạt >= tỉ lệ này so với loại thắng -> câu hỏi mơ hồ
+AMBIGUITY_RATIO = 0.8
+
+
+def _build_router():
+    # keyword bỏ dấu -> [(query_type, weight, keyword gốc, số từ)]
+    entries: Dict[str, List[Tuple[str, float, str, int]]] = {}
+    for query_type, _, weight, keywords in ROUTING_RULES:
+        for keyword in keywords:
+            keyword = unicodedata.normalize('NFC', keyword.lower())
+            entries.setdefault(fold_accents(keyword), []).append(
+                (query_type, weight, keyword, len(keyword.split())))
+
+    def alternation(keys):
+        return '|'.join(re.escape(k) for k in sorted(keys, key=len, reverse=True))
+
+    multi = [k for k in entries if ' ' in k]
+    single = [k for k in entries if ' ' not in k]
+    # keyword nhiều từ chịu được 1 ký tự gõ thừa ở cuối ('học phíe'), keyword 1 từ thì không
+    pattern = re.compile(
+        rf'(?<!\w)(?:(?P<multi>{alternation(multi)})\w?|(?P<single>{alternation(single)})'
+        rf'|(?P<combo>{COMBO_CODE_PATTERN}))(?!\w)'
+    )
+    return pattern, entries
+
+
+_ROUTER_PATTERN, _ROUTER_ENTRIES = _build_router()
+_PRIORITY = {query_type: priority for query_type, priority, _, _ in ROUTING_RULES}
+
+
+def route_query(query: str) -> Dict:
+    """
+    Phân loại câu hỏi bằng keyword trong 1 lần quét (không phân biệt dấu).
+    Trả về:
+        {
+            'query_type': loại thắng hoặc 'others' nếu không khớp keyword nào,
+            'score': điểm loại thắng,
+            'scores': {loại: điểm} giảm dần (gồm cả các loại về sau),
+            'ambiguous': True nếu loại về nhì gần bằng loại thắng
+        }
+    """
+    original = unicodedata.normalize('NFC', query.lower())
+    # span trên chuỗi bỏ dấu phải trùng với chuỗi gốc
+    folded = fold_accents(original)
+    if len(folded) != len(original):
+        folded = ''.join(fold_accents(c) or c for c in original)
+    scores: Dict[str, float] = {}
+    for m in _ROUTER_PATTERN.finditer(folded):
+        if m.group('combo'):
+            scores['subject_combinations'] = scores.get('subject_combinations', 0.0) + 1.0
+            continue
+        group = 'multi' if m.group('multi') else 'single'
+        key = m.group(group)
+        segment = original[m.start(group):m.end(group)]
+        for query_type, weight, keyword, n_words in _ROUTER_ENTRIES[key]:
+            # keyword 1 từ có dấu chỉ khớp đúng dấu hoặc khi người dùng gõ không dấu ('tiền' không khớp 'tiến')
+            if n_words == 1 and segment != keyword and fold_accents(segment) != segment:
+                continue
+            scores[query_type] = scores.get(query_type, 0.0) + weight * n_words
+
+    if not scores:
+        return {'query_type': 'others', 'score': 0.0, 'scores': {}, 'ambiguous': False}
+
+    ranked = sorted(scores.items(), key=lambda item: (item[1], _PRIORITY.get(item[0], -1)), reverse=True)
+    winner, best = ranked[0]
+    ambiguous = len(ranked) > 1 and ranked[1][1] >= best * AMBIGUITY_RATIO
+    return {
+        'query_type': winner,
+        'score': best,
+        'scores': dict(ranked),
+        'ambiguous': ambiguous
+    }
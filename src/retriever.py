@@ -1,87 +1,190 @@
 import json
+import hashlib
+import threading
+import time
+import numpy as np
 from pathlib import Path
-from typing import List, Dict, Optional, Tuple
+from typing import TYPE_CHECKING, List, Dict, Optional, Tuple, Union
 from langchain_core.documents import Document
-from langchain_community.vectorstores import FAISS
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import JsonOutputParser
 from langchain_core.runnables import RunnablePassthrough
-from langchain_google_genai import ChatGoogleGenerativeAI
 import sys
 sys.path.append(str(Path(__file__).resolve().parent.parent))
-from src.utils import parse_score_query,extract_major_from_query, MAJOR_MAPPING
-from config import (VECTOR_DB_DIR, EMBEDDING_MODEL, EMBEDDING_DEVICE, RETRIEVAL_K, SIMILARITY_THRESHOLD,
-                    RERANKER_MODEL,RERANKER_MAX_LENGTH,RERANKER_DEVICE,RERANKER_ENABLE, RERANKER_TOP_K,
+from src.utils import find_majors_in_query, MAJOR_MAPPING
+from src.cache import LRUCache
+from src.components import ComponentRegistry
+from src.query_context import QueryContext
+from src.structured_store import StructuredStore
+from src.structured_index import CutoffScoreIndex, CutoffTable, TuitionIndex, SubjectCombinationIndex
+from src.metadata_store import MetadataStore
+from src.lexical_index import BM25Index
+from src.query_router import route_query
+from src.query_classifier import QueryTypeClassifier
+from config import (VECTOR_DB_DIR, EMBEDDING_MODEL, EMBEDDING_DEVICE, EMBEDDING_BACKEND, EMBEDDING_ONNX_QUANTIZE, RETRIEVAL_K, SIMILARITY_THRESHOLD, PARTITION_DIR_NAME, MAJOR_INDEX_FILE, INDEX_MANIFEST_FILE,
+                    RETRIEVAL_MODE, RRF_K, QUERY_CLASSIFIER_ENABLE, QUERY_CLASSIFIER_THRESHOLD, QUERY_EXEMPLARS_PATH,
+                    QUERY_TYPE_CACHE_SIZE, QUERY_TYPE_CACHE_TTL, CUTOFF_BORDERLINE_MARGIN,
+                    RERANKER_MODEL,RERANKER_MAX_LENGTH,RERANKER_DEVICE,resolve_device,RERANKER_ENABLE, RERANKER_TOP_K,
+                    RERANKER_BATCH_SIZE, RERANKER_CACHE_SIZE, RERANKER_BACKEND, RERANKER_ONNX_QUANTIZE,
+                    RERANKER_SKIP_MARGIN, RERANKER_LATENCY_BUDGET_MS,
                     GEMINI_API_KEY,GEMINI_MODEL,LLM_MAX_TOKENS,LLM_TEMPERATURE)
-from sentence_transformers import CrossEncoder
+# FAISS, sentence-transformers (torch), Gemini import trong hàm load tương ứng để import module này nhanh
+if TYPE_CHECKING:
+    from langchain_community.vectorstores import FAISS
 
 class University_Retrieve:
     def __init__(self, vector_db_path: str = None):
         self.vector_db_path = Path(vector_db_path or VECTOR_DB_DIR)
-        # load embedding model
-        print("Loading embedding model...")
-        self.embedding_model = HuggingFaceEmbeddings(
-            model_name = EMBEDDING_MODEL,
-            model_kwargs = {"device": EMBEDDING_DEVICE},
-            encode_kwargs = {"normalize_embeddings": True}
-        )
-        # load vector database
-        print("Loading vector database...")
-        if self.vector_db_path:
-            self.vector_db = FAISS.load_local(
-                self.vector_db_path,
-                self.embedding_model,
-                allow_dangerous_deserialization=True)
-        else:
-            self.vector_db = None
-        print("Vector database loaded.")
-        # Load structured data
+        # thành phần nặng load khi dùng lần đầu hoặc trong warm_up():
+        # embedding, vector_db (kèm metadata store, BM25, major index) là bắt buộc; reranker, query_llm thì không
+        self.components = ComponentRegistry()
+        self.components.register("embedding", self._load_embedding_model, required=True)
+        self.components.register("vector_db", self._load_vector_db, required=True)
+        self.components.register("reranker", self._load_reranker, enabled=RERANKER_ENABLE)
+        self.components.register("query_llm", self._load_query_llm)
+        self._metadata_store: Optional[MetadataStore] = None
+        self._lexical_index: Optional[BM25Index] = None
+        self._major_index: Dict[str, str] = {}
+        self.llm_query = None
+        # partition theo type, load lazy khi có truy vấn filter type
+        self._partitions: Dict[str, Optional["FAISS"]] = {}
+        # retriever dùng chung giữa các session: mỗi thành phần load lazy chỉ load 1 lần
+        self._load_lock = threading.Lock()
+        # version của index, là 1 phần khóa cache điểm reranker
+        self.index_version = self._load_index_version()
+        # vector của các câu hỏi gần đây: classifier và FAISS dùng chung, mỗi câu chỉ embed 1 lần
+        self._query_vectors = LRUCache(maxsize=256)
+        # bộ phân loại câu hỏi cục bộ, load lazy
+        self._query_classifier: Optional[QueryTypeClassifier] = None
+        # (fingerprint prompt / model, câu hỏi đã chuẩn hóa) -> loại câu hỏi
+        self._query_type_cache = LRUCache(maxsize=QUERY_TYPE_CACHE_SIZE, ttl=QUERY_TYPE_CACHE_TTL)
+        self._query_type_fingerprint_cache = (None, '')
+        # điểm CrossEncoder đã tính: (câu hỏi đã chuẩn hóa, doc, index_version) -> score
+        self._rerank_cache = LRUCache(maxsize=RERANKER_CACHE_SIZE)
+        self._rerank_stats = {'scored_pairs': 0, 'batches': 0, 'scoring_time': 0.0}
+        # quyết định gating của reranker_documents
+        self._rerank_gating = {'calls': 0, 'reranked': 0, 'skipped_fits': 0, 'skipped_margin': 0,
+                               'capped': 0, 'pairs_dropped': 0}
+        # engine dùng chung giữa các session -> cập nhật / đọc thống kê reranker dưới lock
+        self._rerank_stats_lock = threading.Lock()
+        # Load structured data: bản nhị phân memory-map, vector DB cũ chưa có thì đọc structured_data.json
+        self.structured_store = StructuredStore.load(self.vector_db_path)
         structure_path = self.vector_db_path/"structured_data.json"
-        if structure_path.exists():
-            with open(structure_path, "r", encoding="utf-8") as f:
-                self.structured_data = json.load(f)
+        if self.structured_store is not None:
             print("✅ Structured data loaded!")
+        elif structure_path.exists():
+            with open(structure_path, "r", encoding="utf-8") as f:
+                self.structured_store = StructuredStore.from_data(json.load(f))
+            print("⚠️  Structured store not found, loaded structured_data.json (rebuild vector DB to memory-map it)")
         else:
-            self.structured_data = {}
+            self.structured_store = StructuredStore.from_data({})
             print("⚠️  No structured data found")
-        # load reranker model
-        if RERANKER_ENABLE:
-            try:
-                print("Loading reranker model...")
-                self.reranker = CrossEncoder(
-                    model_name= RERANKER_MODEL,
-                    max_length= RERANKER_MAX_LENGTH,
-                    device= RERANKER_DEVICE,
-                )
-                print("✅ Reranker model loaded!")
-            except Exception as e:
-                print(f"⚠️ Failed to load reranker: {e}")
-                print("   Continuing without reranking...")
-                self.reranker = None
-        else:
+        # index điểm chuẩn (major_id, year, to_hop, method) -> dòng điểm, dựng 1 lần
+        self.cutoff_index = CutoffScoreIndex.build(self.structured_store)
+        # bảng điểm chuẩn dạng cột cho cutoff_analytics
+        self.cutoff_table = CutoffTable.build(self.structured_store)
+        # major_id / school_id -> nhóm học phí
+        self.tuition_index = TuitionIndex.build(self.structured_store)
+        # mã tổ hợp -> tổ hợp, môn -> mã tổ hợp
+        self.combination_index = SubjectCombinationIndex.build(self.structured_store)
+        if not RERANKER_ENABLE:
             print("⚠️ Reranking disabled in config")
-            self.reranker = None
-        # Load query LLM
-        try: 
-            self.llm_query = ChatGoogleGenerativeAI(model=GEMINI_MODEL,
-                                           temperature=LLM_TEMPERATURE,
-                                           max_output_tokens=LLM_MAX_TOKENS,
-                                           google_api_key=GEMINI_API_KEY
-                                        )
-            
-            # load prompt
-            self.detect_query_prompt = self._create_query_detect_prompt_template()
-            # setup chain
-            self.detect_query_chain = (
-                {"query": RunnablePassthrough()}
-                |self.detect_query_prompt
-                |self.llm_query
-                |JsonOutputParser()
-            )
-            print("✅ Query detection Gemini connected!")
-        except Exception as e:
-                print(f"⚠️ Failed to initialize Gemini: {e}")
+        # prompt phân loại câu hỏi (nhẹ, tạo luôn); Gemini client tạo khi cần gọi LLM
+        self.detect_query_prompt = self._create_query_detect_prompt_template()
+
+    # ============================================
+    # COMPONENTS (load lazy / warm-up)
+    # ============================================
+    @property
+    def embedding_model(self):
+        return self.components.get("embedding")
+
+    @property
+    def vector_db(self) -> Optional["FAISS"]:
+        return self.components.get("vector_db")
+
+    @property
+    def metadata_store(self) -> Optional[MetadataStore]:
+        # chỉ dùng được sau khi đã kiểm tra khớp với vector_db
+        self.components.get("vector_db")
+        return self._metadata_store
+
+    @property
+    def lexical_index(self) -> Optional[BM25Index]:
+        self.components.get("vector_db")
+        return self._lexical_index
+
+    @property
+    def major_index(self) -> Dict[str, str]:
+        self.components.get("vector_db")
+        return self._major_index
+
+    @property
+    def reranker(self):
+        # None nếu tắt trong config hoặc load lỗi (chạy tiếp không rerank)
+        return self.components.get("reranker")
+
+    @property
+    def detect_query_chain(self):
+        chain = self.components.get("query_llm")
+        if chain is None:
+            raise RuntimeError("Query detection Gemini is not available")
+        return chain
+
+    def _load_vector_db(self) -> "FAISS":
+        from langchain_community.vectorstores import FAISS
+        print("Loading vector database...")
+        vector_db = FAISS.load_local(
+            self.vector_db_path,
+            self.embedding_model,
+            allow_dangerous_deserialization=True)
+        print("Vector database loaded.")
+        # metadata dạng cột để filter bằng numpy
+        metadata_store = MetadataStore.load(self.vector_db_path)
+        if metadata_store and len(metadata_store) != vector_db.index.ntotal:
+            print("⚠️ Metadata store does not match vector database, ignoring it")
+            metadata_store = None
+        # BM25 trên cùng các chunk với FAISS
+        lexical_index = BM25Index.load(self.vector_db_path)
+        if lexical_index and len(lexical_index) != vector_db.index.ntotal:
+            print("⚠️ BM25 index does not match vector database, ignoring it")
+            lexical_index = None
+        self._metadata_store = metadata_store
+        self._lexical_index = lexical_index
+        # major_id -> docstore id
+        self._major_index = self._load_major_index(vector_db)
+        return vector_db
+
+    def _load_query_llm(self):
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        self.llm_query = ChatGoogleGenerativeAI(model=GEMINI_MODEL,
+                                       temperature=LLM_TEMPERATURE,
+                                       max_output_tokens=LLM_MAX_TOKENS,
+                                       google_api_key=GEMINI_API_KEY
+                                    )
+        # setup chain
+        chain = (
+            {"query": RunnablePassthrough()}
+            |self.detect_query_prompt
+            |self.llm_query
+            |JsonOutputParser()
+        )
+        print("✅ Query detection Gemini connected!")
+        return chain
+
+    def readiness(self) -> Dict:
+        # trạng thái từng thành phần (pending / loading / ready / failed / disabled) và warm-up
+        return self.components.status()
+
+    def warm_up(self, questions: Optional[List[str]] = None, background: bool = True):
+        """
+        Load các thành phần bắt buộc, chạy hybrid_search các câu hỏi mẫu (embedding, partition, classifier,
+        reranker, cache), rồi load nốt các thành phần chưa được dùng tới.
+        """
+        steps = [lambda: self.components.get("embedding"), lambda: self.components.get("vector_db")]
+        steps += [lambda q=q: self.hybrid_search(q) for q in questions or []]
+        steps += [lambda: self.components.get("reranker"), lambda: self.components.get("query_llm")]
+        return self.components.warm_up(steps, background=background)
         
     # ============================================
     # Setup LLM để detect query
@@ -121,7 +224,12 @@ class University_Retrieve:
         - Ví dụ: "Ngành AI là gì?", "Cho tôi biết về ngành Marketing"
         - Keywords: thông tin ngành, ngành gì, giới thiệu, tổng quan
 
-        8. **faq**: Các câu hỏi khác không thuộc 7 loại trên
+        8. **cutoff_analytics**: Câu hỏi phân tích trên lịch sử điểm chuẩn: với số điểm của thí sinh thì đậu ngành nào,
+           điểm chuẩn thay đổi qua các năm, so sánh / thống kê điểm chuẩn giữa các trường
+        - Ví dụ: "Em được 22 điểm khối A00 thì đậu ngành nào?", "Điểm chuẩn ngành AI thay đổi thế nào qua các năm?"
+        - Keywords: đậu ngành nào, đủ điểm, thay đổi, xu hướng, qua các năm, cao nhất, thấp nhất, trung bình
+
+        9. **faq**: Các câu hỏi khác không thuộc 8 loại trên
         - Ví dụ: "Trường có ký túc xá không?", "Thời gian đăng ký là khi nào?"
 
         QUAN TRỌNG:
@@ -147,24 +255,212 @@ class University_Retrieve:
     # ============================================
     # BASIC RETRIEVAL
     # ============================================
-    def search(self, query: str, k: int = RETRIEVAL_K, filter_dict: Optional[Dict] = None) -> List[Document]:
+    def build_query_context(self, query: Union[str, QueryContext]) -> QueryContext:
+        # parse câu hỏi 1 lần cho cả request, embedding tính lazy qua cache _embed_query
+        if isinstance(query, QueryContext):
+            return query
+        return QueryContext.build(query, embed_fn=self._embed_query)
+
+    def _embed_query(self, query: str) -> List[float]:
+        # embed câu hỏi, giữ lại 256 câu gần nhất
+        vector = self._query_vectors.get(query)
+        if vector is None:
+            vector = self.embedding_model.embed_query(query)
+            self._query_vectors.set(query, vector)
+        return vector
+
+    def _get_partition(self, doc_type: Optional[str]) -> Optional["FAISS"]:
+        # Load partition của 1 type khi cần, None nếu vector db cũ chưa có partition
+        if not doc_type:
+            return None
+        if doc_type in self._partitions:
+            return self._partitions[doc_type]
+        with self._load_lock:
+            if doc_type not in self._partitions:
+                partition_path = self.vector_db_path / PARTITION_DIR_NAME / doc_type
+                partition = None
+                if (partition_path / "index.faiss").exists():
+                    try:
+                        from langchain_community.vectorstores import FAISS
+                        partition = FAISS.load_local(
+                            partition_path,
+                            self.embedding_model,
+                            allow_dangerous_deserialization=True)
+                        print(f"✅ Partition loaded: {doc_type}")
+                    except Exception as e:
+                        print(f"⚠️ Failed to load partition {doc_type}: {e}")
+                self._partitions[doc_type] = partition
+        return self._partitions[doc_type]
+
+    def _load_major_index(self, vector_db: Optional["FAISS"]) -> Dict[str, str]:
+        major_index_path = self.vector_db_path / MAJOR_INDEX_FILE
+        if major_index_path.exists():
+            with open(major_index_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        # vector db cũ: dựng lại 1 lần từ docstore
+        major_index = {}
+        if vector_db is not None:
+            for doc_id in vector_db.index_to_docstore_id.values():
+                doc = vector_db.docstore.search(doc_id)
+                if isinstance(doc, Document) and doc.metadata.get('type') == 'major' and doc.metadata.get('major_id'):
+                    major_index.setdefault(doc.metadata['major_id'], doc_id)
+        return major_index
+
+    def _load_embedding_model(self):
+        # backend "onnx" lỗi -> dùng lại HuggingFaceEmbeddings (cùng model với lúc build index)
+        print(f"Loading embedding model ({EMBEDDING_BACKEND})...")
+        if EMBEDDING_BACKEND == "onnx":
+            try:
+                from src.onnx_backend import OnnxEmbeddings
+                return OnnxEmbeddings(EMBEDDING_MODEL, quantize=EMBEDDING_ONNX_QUANTIZE)
+            except Exception as e:
+                print(f"⚠️ Failed to load ONNX embeddings: {e}")
+                print("   Falling back to HuggingFaceEmbeddings...")
+        from langchain_huggingface import HuggingFaceEmbeddings
+        return HuggingFaceEmbeddings(
+            model_name = EMBEDDING_MODEL,
+            model_kwargs = {"device": EMBEDDING_DEVICE},
+            encode_kwargs = {"normalize_embeddings": True}
+        )
+
+    def _load_reranker(self):
+        # backend "onnx" lỗi (thiếu onnxruntime/optimum, export lỗi) -> dùng lại CrossEncoder PyTorch
+        print(f"Loading reranker model ({RERANKER_BACKEND})...")
+        if RERANKER_BACKEND == "onnx":
+            try:
+                from src.onnx_backend import OnnxCrossEncoder
+                return OnnxCrossEncoder(RERANKER_MODEL, max_length=RERANKER_MAX_LENGTH, quantize=RERANKER_ONNX_QUANTIZE)
+            except Exception as e:
+                print(f"⚠️ Failed to load ONNX reranker: {e}")
+                print("   Falling back to PyTorch CrossEncoder...")
+        from sentence_transformers import CrossEncoder
+        return CrossEncoder(
+            model_name= RERANKER_MODEL,
+            max_length= RERANKER_MAX_LENGTH,
+            device= resolve_device(RERANKER_DEVICE),
+        )
+
+    def _load_index_version(self) -> str:
+        manifest_path = self.vector_db_path / INDEX_MANIFEST_FILE
+        if manifest_path.exists():
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                return json.load(f).get('index_version', '')
+        # vector db cũ chưa có manifest: dùng thời điểm sửa + kích thước file index
+        index_path = self.vector_db_path / "index.faiss"
+        if index_path.exists():
+            stat = index_path.stat()
+            return f"{stat.st_mtime_ns}-{stat.st_size}"
+        return ''
+
+    def get_major_document(self, major_id: Optional[str]) -> Optional[Document]:
+        # Lấy thẳng document của ngành theo major_id (không embed, không search FAISS)
+        doc_id = self.major_index.get(major_id) if major_id else None
+        if doc_id is None or self.vector_db is None:
+            return None
+        doc = self.vector_db.docstore.search(doc_id)
+        return doc if isinstance(doc, Document) else None
+
+    def get_section_document(self, major_id: Optional[str], section: str) -> Optional[Document]:
+        # section sub-document của ngành (id = <parent_id>#<section>)
+        parent_id = self.major_index.get(major_id) if major_id else None
+        if parent_id is None or self.vector_db is None:
+            return None
+        doc = self.vector_db.docstore.search(f"{parent_id}#{section}")
+        return doc if isinstance(doc, Document) else None
+
+    def _search_partition(self, partition: "FAISS", vector: List[float], k: int, filter_dict: Dict) -> List[Tuple[Document, float]]:
+        # Tìm trong partition, các key filter còn lại (ngoài type) lọc trên toàn partition nên luôn đủ k
+        rest = {key: value for key, value in filter_dict.items() if key != 'type'}
+        if not rest:
+            return partition.similarity_search_with_score_by_vector(vector, k=k)
+        return partition.similarity_search_with_score_by_vector(
+            vector, k=k, filter=rest, fetch_k=partition.index.ntotal)
+
+    def _search_by_selector(self, vector: List[float], k: int, filter_dict: Dict) -> Optional[List[Tuple[Document, float]]]:
+        # Search trên index tổng, chỉ xét các vị trí khớp filter (IDSelector từ metadata store)
+        if self.metadata_store is None:
+            return None
+        selector, positions = self.metadata_store.id_selector(filter_dict)
+        if selector is None:
+            return None
+        if len(positions) == 0:
+            return []
+        import faiss
+        scores, indices = self.vector_db.index.search(
+            np.array([vector], dtype=np.float32), min(k, len(positions)), params=faiss.SearchParameters(sel=selector))
+        results = []
+        for score, i in zip(scores[0], indices[0]):
+            doc = self._doc_at(int(i))
+            if doc is not None:
+                results.append((doc, float(score)))
+        return results
+
+    def _doc_at(self, position: int) -> Optional[Document]:
+        # document tại vị trí position trong FAISS index tổng
+        if position < 0 or self.vector_db is None:
+            return None
+        doc = self.vector_db.docstore.search(self.vector_db.index_to_docstore_id[position])
+        return doc if isinstance(doc, Document) else None
+
+    def _search_filtered(self, vector: List[float], k: int, filter_dict: Dict) -> Optional[List[Tuple[Document, float]]]:
+        # filter chỉ có type -> partition; filter kết hợp -> selector; None nếu vector db cũ
+        if set(filter_dict) != {'type'}:
+            results = self._search_by_selector(vector, k, filter_dict)
+            if results is not None:
+                return results
+        partition = self._get_partition(filter_dict.get('type'))
+        if partition is not None:
+            return self._search_partition(partition, vector, k, filter_dict)
+        return None
+
+    def lexical_search(self, query: str, k: int = RETRIEVAL_K, filter_dict: Optional[Dict] = None) -> List[Document]:
+        # Tìm kiếm BM25 (khớp chính xác mã ngành, tổ hợp, viết tắt...)
+        if self.lexical_index is None:
+            return []
+        allowed = None
+        if filter_dict:
+            allowed = self.metadata_store.mask(filter_dict) if self.metadata_store else None
+            if allowed is None:
+                return []
+        hits = self.lexical_index.search(query, k, allowed)
+        return [doc for doc in (self._doc_at(row) for row, _ in hits) if doc is not None]
+
+    @staticmethod
+    def _rrf_fuse(rankings: List[List[Document]], k: int) -> List[Document]:
+        # Reciprocal-rank fusion: score = sum 1 / (RRF_K + rank)
+        scores, docs = {}, {}
+        for ranking in rankings:
+            for rank, doc in enumerate(ranking, 1):
+                key = doc.metadata.get('doc_id') or doc.page_content
+                scores[key] = scores.get(key, 0.0) + 1.0 / (RRF_K + rank)
+                docs.setdefault(key, doc)
+        ordered = sorted(scores, key=scores.get, reverse=True)
+        return [docs[key] for key in ordered[:k]]
+
+    def search(self, query: Union[str, QueryContext], k: int = RETRIEVAL_K, filter_dict: Optional[Dict] = None, mode: Optional[str] = None) -> List[Document]:
+        # mode "hybrid": gộp FAISS + BM25 bằng RRF, "dense": chỉ FAISS
+        ctx = self.build_query_context(query)
+        docs = self._dense_search(ctx, k, filter_dict)
+        if (mode or RETRIEVAL_MODE) == "hybrid" and self.lexical_index is not None:
+            lexical_docs = self.lexical_search(ctx.query, k, filter_dict)
+            if lexical_docs:
+                docs = self._rrf_fuse([docs, lexical_docs], k)
+        return docs
+
+    def _dense_search(self, ctx: QueryContext, k: int = RETRIEVAL_K, filter_dict: Optional[Dict] = None) -> List[Document]:
         # Tìm kiếm cơ bản
         if self.vector_db is None:
                 return []
         try:
             if filter_dict:
-                raw_data = self.vector_db.similarity_search(query=query, k=k*4)
-                filter_results = []
-                for doc in raw_data:
-                    match = all(
-                        doc.metadata.get(key) == value
-                        for key,value in filter_dict.items()
-                    )
-                    if match:
-                        filter_results.append(doc)
-                return filter_results[:k]
+                results = self._search_filtered(ctx.embedding, k, filter_dict)
+                if results is not None:
+                    return [doc for doc, _ in results]
+
+                raw_data = self.vector_db.similarity_search_by_vector(ctx.embedding, k=k*4)
+                return self._filter_docs_by_metadata(raw_data, filter_dict, target_count=k)
             else:
-                return self.vector_db.similarity_search(query=query, k=k)
+                return self.vector_db.similarity_search_by_vector(ctx.embedding, k=k)
             
         except Exception as e:
             print(f"⚠️ Search error: {e}")
@@ -172,7 +468,7 @@ class University_Retrieve:
        
     def search_with_score(
             self,
-            query: str,
+            query: Union[str, QueryContext],
             k: int = RETRIEVAL_K,
             score_threshold: float = SIMILARITY_THRESHOLD,
             filter_dict: Optional[Dict] = None
@@ -180,9 +476,14 @@ class University_Retrieve:
             """Tìm kiếm kèm điểm số"""
             if self.vector_db is None:
                 return []
+            ctx = self.build_query_context(query)
             try:
                 if filter_dict:
-                    raw_data = self.vector_db.similarity_search_with_score(query=query, k=k*4)
+                    results = self._search_filtered(ctx.embedding, k, filter_dict)
+                    if results is not None:
+                        return [(doc, score) for doc, score in results if score >= score_threshold]
+
+                    raw_data = self.vector_db.similarity_search_with_score_by_vector(ctx.embedding, k=k*4)
                     filter_results = []
                     for doc, score in raw_data:
                         if score >= score_threshold:
@@ -191,10 +492,10 @@ class University_Retrieve:
                                 for key,value in filter_dict.items()
                             )
                             if match:
-                                filter_results.append(doc)
+                                filter_results.append((doc, score))
                     return filter_results[:k]
                 else:
-                    results = self.vector_db.similarity_search_with_score(query=query, k=k)
+                    results = self.vector_db.similarity_search_with_score_by_vector(ctx.embedding, k=k)
                     return [(doc, score) for doc, score in results if score >= score_threshold]
                 
             except Exception as e:
@@ -204,216 +505,270 @@ class University_Retrieve:
     # ============================================
     # QUERY ROUTING
     # ============================================
-    # Chọn loại detect 1. detect = keyword , 2. detect = llm
-    def detect_query_type(self,query: str )-> str:
-        keyword_type = self._detect_with_keywords(query)
+    # Chọn loại detect 1. detect = keyword , 2. detect = classifier cục bộ, 3. detect = llm
+    def detect_query_type(self,query: Union[str, QueryContext] )-> str:
+        ctx = self.build_query_context(query)
+        cache_key = (self._query_type_fingerprint(), ctx.normalized)
+        cached_type = self._query_type_cache.get(cache_key)
+        if cached_type is not None:
+            return cached_type
+
+        keyword_type = self._detect_with_keywords(ctx.query)
         if keyword_type != "others":
+            self._query_type_cache.set(cache_key, keyword_type)
             return keyword_type
 
-        return self._detect_query_with_LLM(query)
+        local_type = self._detect_with_classifier(ctx)
+        if local_type:
+            self._query_type_cache.set(cache_key, local_type)
+            return local_type
+
+        try:
+            query_type = self._classify_with_LLM(ctx.query)
+        except Exception as e:
+            # lỗi Gemini thường là tạm thời -> không cache kết quả fallback
+            print(f"⚠️ Gemini detection error: {e}")
+            print("   Falling back to keyword-based detection...")
+            return self._detect_with_keywords(ctx.query)
+        self._query_type_cache.set(cache_key, query_type)
+        return query_type
+
+    def _query_type_fingerprint(self) -> str:
+        # prompt detect đang dùng + model Gemini / embedding + cấu hình classifier:
+        # gán prompt mới lúc chạy -> khóa cache khác, entry cũ tự bị đẩy ra theo LRU / TTL
+        # (hash lại chỉ khi prompt là object khác, giữ tham chiếu nên không nhầm id)
+        prompt = getattr(self, 'detect_query_prompt', None)
+        cached_prompt, fingerprint = self._query_type_fingerprint_cache
+        if prompt is cached_prompt and fingerprint:
+            return fingerprint
+        parts = [
+            repr(prompt.messages) if prompt is not None else '',
+            GEMINI_MODEL,
+            EMBEDDING_MODEL,
+            str(QUERY_CLASSIFIER_ENABLE),
+            str(QUERY_CLASSIFIER_THRESHOLD),
+        ]
+        fingerprint = hashlib.sha1('\n'.join(parts).encode('utf-8')).hexdigest()
+        self._query_type_fingerprint_cache = (prompt, fingerprint)
+        return fingerprint
+
+    def invalidate_query_type_cache(self):
+        # gọi khi fit lại classifier hoặc sửa câu hỏi mẫu lúc đang chạy (centroid không nằm trong fingerprint)
+        self._query_type_cache.clear()
+        self._query_classifier = None
+
+    def get_cache_stats(self) -> Dict[str, Dict]:
+        return {
+            'query_type': self._query_type_cache.stats(),
+            'query_vectors': self._query_vectors.stats(),
+            'reranker': {
+                **self._rerank_cache.stats(),
+                **self._rerank_stats_snapshot(),
+            },
+        }
+
+    def _rerank_stats_snapshot(self) -> Dict:
+        with self._rerank_stats_lock:
+            return {
+                'scored_pairs': self._rerank_stats['scored_pairs'],
+                'batches': self._rerank_stats['batches'],
+                'scoring_time_ms': round(self._rerank_stats['scoring_time'] * 1000, 2),
+                'gating': dict(self._rerank_gating)
+            }
+
+    def _count_gating(self, **counts: int):
+        with self._rerank_stats_lock:
+            for name, value in counts.items():
+                self._rerank_gating[name] += value
     
     # Phát hiện loại truy vấn
     def _detect_with_keywords(self, query: str) -> str:
-        query_lower = query.lower()
-        if any(kw in query_lower for kw in ['điểm','diem','điểm chuẩn', 'diem chuan', 'điểm đầu vào']):
-            return "cutoff_scores" 
-        if any(kw in query_lower for kw in ['tổ hợp', 'to hop', 'môn thi', 'a00', 'a01']):
-            return "subject_combinations"
-        if any(kw in query_lower for kw in ['tiền','phí','học phí', 'hoc phi', 'mức phí', 'chi phí']):
-            return "tuition"
-        if any(kw in query_lower for kw in ['làm gì', 'lam gi', 'ra trường', 'nghề nghiệp', 'việc làm', 'cơ hội việc làm', 'vị trí công việc']):
-            return "career"
-        if any(kw in query_lower for kw in ['học gì', 'hoc gi', 'học những gì','học những môn', 'môn gì', 'mon gi', 'môn học', 'chương trình', 'curriculum']):
-            return "curriculum_major"
-        if any(kw in query_lower for kw in ['phương thức', 'xét tuyển', 'xet tuyen', 'tuyển sinh', 'đăng ký']):
-            return "admission_methods"
-        if any(kw in query_lower for kw in ['ngành', 'nganh', 'chuyên ngành', 'major']):
-            return "major_infor"
-        if any(kw in query_lower for kw in ['Khó','khó']):
-            return "faq"
-        return 'others'
-
-    # detect loại câu hỏi bằng llm
-    def _detect_query_with_LLM(self, query:str)->str:
-            try:
-                result = self.detect_query_chain.invoke(query)
-                query_type = result.get("query_type", "faq")
-                confidence = result.get("confidence", 0.0)
-                reasoning = result.get("reasoning", "")
-                
-                # # Log kết quả
-                # print(f"🤖 Gemini Detection: {query_type} (confidence: {confidence:.2f})")
-                # if reasoning:
-                #     print(f"   Reasoning: {reasoning}")
-
-                #fall back detect with keyword
-                if confidence < 0.5:
-                    print(f"⚠️  Low confidence, trying keyword-based detection...")
-                    fallback_type = self._detect_with_keywords(query)
-                    print(f"   Keyword detection suggests: {fallback_type}")
-                    return fallback_type
+        # 1 lần quét regex đã compile (src/query_router.py), 'others' nếu không khớp keyword nào
+        return route_query(query)['query_type']
+
+    def _get_query_classifier(self) -> Optional[QueryTypeClassifier]:
+        # centroid lưu lúc build; nếu thiếu hoặc khác embedding model thì fit lại từ file câu hỏi mẫu
+        if self._query_classifier is None:
+            with self._load_lock:
+                if self._query_classifier is None:
+                    classifier = QueryTypeClassifier.load(self.vector_db_path)
+                    if (classifier is None or classifier.model_name != EMBEDDING_MODEL) and QUERY_EXEMPLARS_PATH.exists():
+                        classifier = QueryTypeClassifier.from_file(QUERY_EXEMPLARS_PATH, self.embedding_model, EMBEDDING_MODEL)
+                    self._query_classifier = classifier
+        return self._query_classifier
+
+    # detect loại câu hỏi bằng classifier cục bộ, None nếu không đủ tin cậy
+    def _detect_with_classifier(self, query: Union[str, QueryContext]) -> Optional[str]:
+        if not QUERY_CLASSIFIER_ENABLE:
+            return None
+        try:
+            classifier = self._get_query_classifier()
+            if classifier is None:
+                return None
+            query_type, confidence, _ = classifier.predict(self.build_query_context(query).embedding)
+            if confidence >= QUERY_CLASSIFIER_THRESHOLD:
                 return query_type
-            except Exception as e:
-                print(f"⚠️ Gemini detection error: {e}")
-                print("   Falling back to keyword-based detection...")
-                return self._detect_with_keywords(query)
+        except Exception as e:
+            print(f"⚠️ Query classifier error: {e}")
+        return None
+
+    # gọi Gemini, lỗi thì raise để bên gọi quyết định fallback
+    def _classify_with_LLM(self, query:str)->str:
+            result = self.detect_query_chain.invoke(query)
+            query_type = result.get("query_type", "faq")
+            confidence = result.get("confidence", 0.0)
+            reasoning = result.get("reasoning", "")
+            
+            # # Log kết quả
+            # print(f"🤖 Gemini Detection: {query_type} (confidence: {confidence:.2f})")
+            # if reasoning:
+            #     print(f"   Reasoning: {reasoning}")
+
+            #fall back detect with keyword
+            if confidence < 0.5:
+                print(f"⚠️  Low confidence, trying keyword-based detection...")
+                fallback_type = self._detect_with_keywords(query)
+                print(f"   Keyword detection suggests: {fallback_type}")
+                return fallback_type
+            return query_type
     
     # ============================================
     # STRUCTURED DATA RETRIEVAL
     # ============================================
-    def _get_structured_scores(self, query: str) -> List[Document]:
+    def _get_structured_scores(self, query: Union[str, QueryContext]) -> List[Document]:
         # Tìm kiếm diem số từ dữ liệu có cấu trúc
-        parsed = parse_score_query(query=query)
-        all_scores = []
-        for key,value in self.structured_data.items():
-            if "diem_" in key and isinstance(value,dict) and "data" in value:
-                score_data = value['data']
-                if parsed.get('year'):
-                    score_data= [s for s in score_data if s.get('year') == parsed['year']]
-                
-                if parsed.get('major_id'):
-                    score_data= [s for s in score_data if s.get('major_id') == parsed['major_id']]
-                elif parsed.get('major_name'):
-                    major_name_lower = parsed['major_name'].lower()
-                    score_data = [
-                        s for s in score_data
-                        if major_name_lower in s.get('major_name', '').lower()
-                    ]
-                
-                if parsed.get('to_hop'):
-                    score_data= [s for s in score_data if s.get('to_hop') == parsed['to_hop']]
-                
-                all_scores.extend(score_data)
-        if all_scores:
-            all_scores.sort(key=lambda x: x.get('year', 0), reverse=True)
+        parsed = self.build_query_context(query).score_query
+        scores, total = self.cutoff_index.lookup(
+            major_id=parsed.get('major_id'),
+            year=parsed.get('year'),
+            to_hop=parsed.get('to_hop'),
+            major_name=parsed.get('major_name'),
+            limit=10  # Lấy top 10
+        )
+        if total:
             return {
-                'scores': all_scores[:10],  # Lấy top 10
-                'total': len(all_scores),
+                'scores': scores,
+                'total': total,
                 'query_info': parsed
             } 
         return None
     
-    def _get_structured_combinations(self, query:str) -> List[Document]:
-        # Tìm kiếm tổ hợp từ dữ liệu có cấu trúc
-        query_upper = query.upper()
-        combo_codes =  ['A00', 'A01', 'A02', 'B00', 'B01', 'B02', 'C00', 'C01', 
-                       'D01', 'D02', 'D03', 'D04', 'D05', 'D06', 'D07', 'D14',
-                       'V00', 'V01', 'H00', 'H01', 'DD2']
-        to_hop_data = self.structured_data.get("to_hop")
-        if not to_hop_data:
+    def _get_structured_analytics(self, query: Union[str, QueryContext]) -> Optional[Dict]:
+        # phân tích điểm chuẩn: có điểm thí sinh -> ngành đủ điểm, có ngành -> biến động qua các năm, còn lại -> thống kê theo trường
+        ctx = self.build_query_context(query)
+        if not len(self.cutoff_table):
             return None
-        combinations = to_hop_data.get('combinations', [])
-        found_code = None
-        for code in combo_codes:
-            if code in query_upper:
-                found_code = code
-                break
-        if found_code:
-            combinations = [c for c in combinations if c.get("code") == found_code]
+        if ctx.user_score is not None:
+            analysis = 'eligibility'
+            data = self.cutoff_table.eligibility(ctx.user_score, to_hop=ctx.to_hop, year=ctx.year,
+                                                 major_id=ctx.major_id, margin=CUTOFF_BORDERLINE_MARGIN)
+        elif ctx.major_id:
+            analysis = 'trend'
+            data = self.cutoff_table.trend(major_id=ctx.major_id, to_hop=ctx.to_hop)
+        else:
+            analysis = 'school_summary'
+            data = self.cutoff_table.school_summary(year=ctx.year, to_hop=ctx.to_hop)
         return {
-            'description': to_hop_data.get('description', ''),
-            'combinations': combinations,
-            'total': len(to_hop_data.get('combinations', []))
+            'analysis': analysis,
+            'result': data,
+            'query_info': {
+                'user_score': ctx.user_score,
+                'major_id': ctx.major_id,
+                'year': ctx.year,
+                'to_hop': ctx.to_hop
+            }
         }
-    
-    def _get_structured_tuitions(self, query:str) -> List[Document]:
-        # Tìm kiếm học phí từ dữ liệu có cấu trúc
-        tuition_data = self.structured_data.get('hoc_phi', {})
-        
-        if not tuition_data:
+
+    def _get_structured_combinations(self, query: Union[str, QueryContext]) -> List[Document]:
+        # Tìm kiếm tổ hợp từ dữ liệu có cấu trúc: mọi mã tổ hợp trong câu hỏi, hoặc theo tên môn
+        if not self.combination_index:
             return None
-        
-        result = {
-            'university': tuition_data.get('university', ''),
-            'currency': tuition_data.get('currency', 'VND'),
-            'calculation_method': tuition_data.get('calculation_method', ''),
-            'tuition_groups': tuition_data.get('tuition_groups', []),
-            'notes': tuition_data.get('notes', [])
-        }
-        
-        major_infor = extract_major_from_query(query)
-        if major_infor:
-            major_id = major_infor['major_id']
-            result['tuition_groups'] = [
-                g for g in result['tuition_groups']
-                if major_id in g.get('major_id',[]) or self._match_group_by_major(g.get('group_id', ''), major_infor['school_id'])
-            ]
-        return result
+        return self.combination_index.lookup(self.build_query_context(query).query)
     
-    def _match_group_by_major(self, group_id: str, school_id:str) -> bool:
-        mapping = {
-            'CNTT': 'CS',
-            'ECON': 'ECON',
-            'MED': 'MED',
-            'TOUR': 'TOUR',
-            'LANG': 'LANG',
-            'ENG': 'ENG'
-        }
-        return mapping.get(group_id) == school_id
+    def _get_structured_tuitions(self, query: Union[str, QueryContext]) -> List[Document]:
+        # Tìm kiếm học phí từ dữ liệu có cấu trúc: tra index theo ngành, fallback theo trường
+        if not self.tuition_index:
+            return None
+        return self.tuition_index.record(self.build_query_context(query).major_info)
     
     # ============================================
     # HYBRID SEARCH
     # ============================================
-    def hybrid_search(self, query: str, k: int = RETRIEVAL_K, score_threshold: float = SIMILARITY_THRESHOLD, filter_dict: Optional[Dict] = None) -> List[Tuple[Document, float]]:
-        # Tìm kiếm kết hợp semantic + structured
-        query_type = self.detect_query_type(query)
-        major_info = extract_major_from_query(query)
-        major_id = major_info['major_id'] if major_info else None
+    def hybrid_search(self, query: Union[str, QueryContext], k: int = RETRIEVAL_K, score_threshold: float = SIMILARITY_THRESHOLD, filter_dict: Optional[Dict] = None, mode: Optional[str] = None) -> List[Tuple[Document, float]]:
+        # Tìm kiếm kết hợp semantic + structured, mode: "dense" | "hybrid" (mặc định RETRIEVAL_MODE)
+        # parse + embed câu hỏi 1 lần, mọi bước bên dưới dùng chung ctx
+        ctx = self.build_query_context(query)
+        ctx.query_type = query_type = self.detect_query_type(ctx)
+        # hỏi điểm chuẩn kèm điểm của thí sinh ('22 điểm có đỗ AI không') -> phân tích đủ điểm
+        if query_type == "cutoff_scores" and ctx.user_score is not None:
+            ctx.query_type = query_type = "cutoff_analytics"
+        major_id = ctx.major_id
         results = {
             'query_type': query_type,
             'semantic_results': [],
             'structured_results': None,
             'context': '',
-            'major_info': extract_major_from_query(query)
+            'major_info': ctx.major_info
         }
 
         if query_type == "cutoff_scores":
-            results['structured_results'] = self._get_structured_scores(query)
-            docs = self.search(query,k = k,filter_dict= {'type': "cutoff_analysis"})
-            docs = self._enhance_with_major_context(query, docs)
+            results['structured_results'] = self._get_structured_scores(ctx)
+            docs = self.search(ctx,k = k,filter_dict= {'type': "cutoff_analysis"}, mode=mode)
+            docs = self._enhance_with_major_context(ctx, docs)
             results['semantic_results'] = docs[:k]
         
+        elif query_type == "cutoff_analytics":
+            results['structured_results'] = self._get_structured_analytics(ctx)
+            if major_id:
+                docs = self.search(ctx,k = k,filter_dict= {'type': "cutoff_analysis"}, mode=mode)
+                results['semantic_results'] = self._enhance_with_major_context(ctx, docs)[:k]
+
         elif query_type == "tuition":
-            results['structured_results'] = self._get_structured_tuitions(query)
+            results['structured_results'] = self._get_structured_tuitions(ctx)
       
         elif query_type == "subject_combinations":
             if major_id:
-                docs = self._search_major_content(query, major_id,k, content_type='admission')
+                docs = self._search_major_content(ctx, major_id,k, content_type='admission', mode=mode)
                 results['semantic_results'] = docs
             else:
-                results['structured_results'] = self._get_structured_combinations(query)
+                results['structured_results'] = self._get_structured_combinations(ctx)
         
         elif query_type == "career":
-            docs = self._search_major_content(query, major_id,k, content_type='career')
+            docs = self._search_major_content(ctx, major_id,k, content_type='career', mode=mode)
             results['semantic_results'] = docs
 
         elif query_type == "curriculum_major":
-            docs = self._search_major_content(query, major_id,k, content_type='curriculum')
+            docs = self._search_major_content(ctx, major_id,k, content_type='curriculum', mode=mode)
             results['semantic_results'] = docs
 
         elif query_type == "admission_methods":
-            results['semantic_results'] = self.search(query, k=k, filter_dict={'type': "admission_methods"})
+            # đã biết ngành thì chỉ cần section tuyển sinh của ngành, không search phương thức chung
             if major_id:
-                docs = self._search_major_content(query, major_id,k, content_type='admission')
+                docs = self._search_major_content(ctx, major_id,k, content_type='admission', mode=mode)
                 results['semantic_results'] = docs
+            else:
+                results['semantic_results'] = self.search(ctx, k=k, filter_dict={'type': "admission_method"}, mode=mode)
         
         elif query_type == "major_info":
-            docs = self._search_major_docs(query, major_id, k)
+            docs = self._search_major_docs(ctx, major_id, k, mode=mode)
             results['semantic_results'] = docs
 
         elif query_type == "faq":
-            docs = self.search(query,k = k,filter_dict={'type' : 'faq'})
+            docs = self.search(ctx,k = k,filter_dict={'type' : 'faq'}, mode=mode)
             if not docs and major_id:
-                docs = self.search(query= major_id, k= k*5, filter_dict={'type':'major','major_id': major_id})
-            docs = self._enhance_with_major_context(query,docs)
+                major_doc = self.get_major_document(major_id)
+                docs = [major_doc] if major_doc else []
+            docs = self._enhance_with_major_context(ctx,docs)
             results['semantic_results'] = docs[:k]
         
         else:
-            results['semantic_results'] = self.search(query, k=k)
+            results['semantic_results'] = self.search(ctx, k=k, mode=mode)
         
         #reranker
-        if results['semantic_results'] and RERANKER_ENABLE and self.reranker:
-            results['semantic_results'] = self.reranker_documents(query, results['semantic_results'], top_k= RERANKER_TOP_K)
+        # hybrid (RRF) không có điểm chung giữa dense và BM25 -> cần CrossEncoder sắp lại dù số doc <= top_k
+        if results['semantic_results'] and RERANKER_ENABLE:
+            results['semantic_results'] = self.reranker_documents(ctx, results['semantic_results'], top_k=min(k, RERANKER_TOP_K),
+                                                                  need_order=(mode or RETRIEVAL_MODE) == "hybrid")
         
         results['context'] = self.build_context(results)
         return results
@@ -454,7 +809,7 @@ class University_Retrieve:
         if result['structured_results']:
             context_parts.append("\n=== DỮ LIỆU CHÍNH XÁC ===")
             context_parts.append(
-                json.dumps(result['structured_results'], ensure_ascii=False, indent=2)
+                json.dumps(result['structured_results'], ensure_ascii=False, separators=(',', ':'))
             )
         
         return "\n".join(context_parts)
@@ -464,43 +819,58 @@ class University_Retrieve:
     # ============================================
     def _filter_docs_by_metadata(self, docs: List[Document], filter_dict: Dict, target_count: int =None):
         # lọc các doc theo bộ 
-        filtered = []
-        for doc in docs:
-            match = all(
-                doc.metadata.get(key) == value
-                for key,value in filter_dict.items()
-            )
-            if match:
-                filtered.append(doc)
+        mask = None
+        if self.metadata_store and docs:
+            rows = self.metadata_store.rows(docs)
+            if (rows >= 0).all():
+                mask = self.metadata_store.mask(filter_dict, rows)
+        if mask is not None:
+            filtered = [doc for doc, keep in zip(docs, mask) if keep]
+        else:
+            filtered = []
+            for doc in docs:
+                match = all(
+                    doc.metadata.get(key) == value
+                    for key,value in filter_dict.items()
+                )
+                if match:
+                    filtered.append(doc)
          # Debug logging
         if len(filtered) < len(docs):
             print(f"🔍 Filtered: {len(docs)} → {len(filtered)} docs (filter: {filter_dict})")
         
         return filtered[:target_count] if target_count else filtered
     
-    def _enhance_with_major_context(self, query: str, docs: List[Document]) -> List[Document]:  
+    def _enhance_with_major_context(self, query: Union[str, QueryContext], docs: List[Document]) -> List[Document]:  
         """Ưu tiên docs liên quan đến ngành trong query"""
-        major_info = extract_major_from_query(query)
+        major_info = self.build_query_context(query).major_info
         
         if not major_info or not docs:
             return docs
         
         major_id = major_info['major_id']
-        variants = major_info['variants']
+        
+        # Doc -> ngành đã tính sẵn lúc build, chỉ tính lại cho doc không có trong store
+        relevance = None
+        if self.metadata_store:
+            rows = self.metadata_store.rows(docs)
+            relevance = self.metadata_store.major_relevance(np.maximum(rows, 0), major_id)
         
         # Phân loại docs
         relevant_docs = []
         other_docs = []
         
-        for doc in docs:
-            content_lower = doc.page_content.lower()
-            metadata_str = json.dumps(doc.metadata, ensure_ascii=False).lower()
-            
-            # Check nếu doc liên quan đến major
-            is_relevant = (
-                major_id.lower() in metadata_str or
-                any(variant in content_lower for variant in variants)
-            )
+        for i, doc in enumerate(docs):
+            if relevance is not None and rows[i] >= 0:
+                is_relevant = bool(relevance[i])
+            else:
+                metadata_str = json.dumps(doc.metadata, ensure_ascii=False).lower()
+                
+                # Check nếu doc liên quan đến major
+                is_relevant = (
+                    major_id.lower() in metadata_str or
+                    any(m['major_id'] == major_id for m in find_majors_in_query(doc.page_content))
+                )
             
             if is_relevant:
                 relevant_docs.append(doc)
@@ -509,23 +879,40 @@ class University_Retrieve:
         
         return relevant_docs + other_docs
 
-    def _search_major_docs(self, query:str, major_id: Optional[str], k:int) ->  List[Document]:
-        # search major doc lien quan den cau hoi
-        docs = self.search(query,k = k,filter_dict={'type' : 'major'})
-        if not docs:
-            docs = self.search(query= major_id, k= k*5, filter_dict={'type':'major','major_id': major_id})
-        docs = self._enhance_with_major_context(query,docs)
-        if major_id :
-            major_filtered = [
-                d for d in docs
-                if d.metadata.get("major_id") == major_id
-            ]
-            docs = major_filtered if major_filtered else docs
+    def _search_major_docs(self, ctx: QueryContext, major_id: Optional[str], k:int, mode: Optional[str] = None) ->  List[Document]:
+        # đã biết ngành -> lấy thẳng document ngành
+        major_doc = self.get_major_document(major_id)
+        if major_doc:
+            return [major_doc]
+        # search trên section ngắn (<parent_id>#<section>), mỗi ngành giữ section khớp nhất
+        # -> reranker chấm text ngắn thay vì document ngành đầy đủ
+        sections = self.search(ctx, k=k*3, filter_dict={'type': 'major_section'}, mode=mode)
+        if sections:
+            docs, seen = [], set()
+            for section in sections:
+                parent_id = section.metadata.get('parent_id')
+                if parent_id not in seen:
+                    seen.add(parent_id)
+                    docs.append(section)
+        else:
+            # search major doc lien quan den cau hoi
+            docs = self.search(ctx,k = k,filter_dict={'type' : 'major'}, mode=mode)
+        docs = self._enhance_with_major_context(ctx,docs)
         return docs[:k]
     
-    def _search_major_content(self, query: str, major_id: Optional[str], k:int, content_type:str) ->List[Document]:
-        # extract thông tin liên quan đến câu hỏi trong doc
-        docs = self._search_major_docs(query, major_id, k*3)
+    def _search_major_content(self, ctx: QueryContext, major_id: Optional[str], k:int, content_type:str, mode: Optional[str] = None) ->List[Document]:
+        # section dựng sẵn lúc build: đã biết ngành -> lấy thẳng, chưa biết -> search trong các section cùng loại
+        if major_id:
+            section_doc = self.get_section_document(major_id, content_type)
+            if section_doc:
+                return [section_doc]
+        else:
+            section_docs = self.search(ctx, k=k, filter_dict={'type': 'major_section', 'section': content_type}, mode=mode)
+            if section_docs:
+                return self._enhance_with_major_context(ctx, section_docs)[:k]
+
+        # vector db cũ chưa có section: extract thông tin liên quan đến câu hỏi trong doc
+        docs = self._search_major_docs(ctx, major_id, k*3, mode=mode)
         content_keywords = {
             'career': ['vị trí', 'công việc', 'nơi làm việc', 'mức lương', 
                       'nghề nghiệp', 'career', 'positions', 'workplace', 'salary'],
@@ -610,27 +997,42 @@ class University_Retrieve:
         return extracted
     
     def reranker_documents(self,
-                           query:str,
+                           query: Union[str, QueryContext],
                            documents: List[Document],
                            top_k:Optional[int] = None,
-                           debug: bool = False) -> List[Document]:
+                           debug: bool = False,
+                           need_order: bool = False) -> List[Document]:
     # Rerank documents dựa trên độ liên quan với query sử dụng CrossEncoder
-        if not self.reranker:
-            if debug:
-                print("⚠️ Reranker not available, returning original docs")
-            return documents
-        
-        if not documents:
-            return []
-        
+    # need_order=False: số doc <= top_k thì giữ nguyên, không cần CrossEncoder sắp xếp lại
+        # gating: chỉ chạy CrossEncoder khi có thể thay đổi kết quả
+        self._count_gating(calls=1)
         if len(documents)<= 1:
+            self._count_gating(skipped_fits=1)
             return documents
         
         top_k = top_k or RERANKER_TOP_K
+        ctx = self.build_query_context(query)
+        query = ctx.query
+
+        if len(documents) <= top_k and not need_order:
+            self._count_gating(skipped_fits=1)
+            return documents
+        decisive = self._decisive_document(ctx, documents)
+        if decisive is not None:
+            self._count_gating(skipped_margin=1)
+            if debug:
+                print(f"⏭️ Dense margin decisive, skipping rerank")
+            return ([documents[decisive]] + documents[:decisive] + documents[decisive + 1:])[:top_k]
+        # chỉ load CrossEncoder khi thật sự phải rerank
+        if not self.reranker:
+            if debug:
+                print("⚠️ Reranker not available, returning original docs")
+            return documents[:top_k]
+        documents = self._cap_by_latency_budget(documents, top_k)
+        self._count_gating(reranked=1)
 
         try :
-            pairs = [[query,doc.page_content] for doc in documents]
-            reranker_score = self.reranker.predict(pairs)
+            reranker_score = self._score_documents(ctx, documents)
             doc_score_pairs = list(zip(documents, reranker_score))
             doc_score_pairs.sort(key= lambda x:x[1], reverse= True)
 
@@ -662,6 +1064,74 @@ class University_Retrieve:
             print(f"   Falling back to original top {top_k} docs")
             return documents[:top_k]
 
+    def _dense_similarities(self, ctx: QueryContext, documents: List[Document]) -> Optional[np.ndarray]:
+        # cosine câu hỏi - doc (vector đã normalize) lấy lại từ FAISS index, None nếu có doc không nằm trong index
+        if self.metadata_store is None or self.vector_db is None:
+            return None
+        if any('content_type' in doc.metadata for doc in documents):
+            return None
+        rows = self.metadata_store.rows(documents)
+        if (rows < 0).any():
+            return None
+        vectors = self.vector_db.index.reconstruct_batch(rows)
+        return vectors @ np.asarray(ctx.embedding, dtype=np.float32)
+
+    def _decisive_document(self, ctx: QueryContext, documents: List[Document]) -> Optional[int]:
+        # vị trí doc có cosine vượt hẳn các doc còn lại (>= RERANKER_SKIP_MARGIN), None nếu không rõ ràng
+        if not RERANKER_SKIP_MARGIN:
+            return None
+        try:
+            similarities = self._dense_similarities(ctx, documents)
+        except Exception as e:
+            print(f"⚠️ Dense similarity error: {e}")
+            return None
+        if similarities is None or len(similarities) < 2:
+            return None
+        order = np.argsort(-similarities)
+        if similarities[order[0]] - similarities[order[1]] >= RERANKER_SKIP_MARGIN:
+            return int(order[0])
+        return None
+
+    def _cap_by_latency_budget(self, documents: List[Document], top_k: int) -> List[Document]:
+        # ước tính thời gian chấm 1 cặp từ các lần trước, cắt bớt candidate cuối danh sách nếu vượt ngân sách
+        with self._rerank_stats_lock:
+            scored_pairs = self._rerank_stats['scored_pairs']
+            scoring_time = self._rerank_stats['scoring_time']
+        if not RERANKER_LATENCY_BUDGET_MS or not scored_pairs:
+            return documents
+        per_pair_ms = scoring_time * 1000 / scored_pairs
+        cap = max(top_k, int(RERANKER_LATENCY_BUDGET_MS / max(per_pair_ms, 1e-6)))
+        if len(documents) <= cap:
+            return documents
+        self._count_gating(capped=1, pairs_dropped=len(documents) - cap)
+        return documents[:cap]
+
+    def _rerank_cache_key(self, ctx: QueryContext, doc: Document) -> Tuple[str, str, str]:
+        # doc đã bị cắt nội dung (content_type) không trùng nội dung với doc_id gốc -> khóa theo hash nội dung
+        doc_key = doc.metadata.get('doc_id')
+        if not doc_key or 'content_type' in doc.metadata:
+            doc_key = hashlib.sha1(doc.page_content.encode('utf-8')).hexdigest()
+        return (ctx.normalized, doc_key, self.index_version)
+
+    def _score_documents(self, ctx: QueryContext, documents: List[Document]) -> List[float]:
+        # lấy điểm từ cache, chỉ chấm các doc chưa có theo batch RERANKER_BATCH_SIZE
+        keys = [self._rerank_cache_key(ctx, doc) for doc in documents]
+        scores = [self._rerank_cache.get(key) for key in keys]
+        missing = [i for i, score in enumerate(scores) if score is None]
+        if missing:
+            pairs = [[ctx.query, documents[i].page_content] for i in missing]
+            start = time.perf_counter()
+            new_scores = self.reranker.predict(pairs, batch_size=RERANKER_BATCH_SIZE, show_progress_bar=False)
+            elapsed = time.perf_counter() - start
+            with self._rerank_stats_lock:
+                self._rerank_stats['scoring_time'] += elapsed
+                self._rerank_stats['scored_pairs'] += len(pairs)
+                self._rerank_stats['batches'] += -(-len(pairs) // RERANKER_BATCH_SIZE)
+            for i, score in zip(missing, new_scores):
+                scores[i] = float(score)
+                self._rerank_cache.set(keys[i], scores[i])
+        return scores
+
 if __name__ == "__main__":
     print("\n🧪 Testing Retriever (Semantic + Structured)...\n")
 
@@ -740,7 +1210,7 @@ if __name__ == "__main__":
     #         print(f"\n📝 Query: {query}")
             
     #         # Detect với Gemini
-    #         llm_type = retriever._detect_query_with_LLM(query)
+    #         llm_type = retriever._classify_with_LLM(query)
             
     #         # Detect với keyword để so sánh
     #         keyword_type = retriever._detect_with_keywords(query)
@@ -0,0 +1,441 @@
+import re
+import unicodedata
+import numpy as np
+from pathlib import Path
+from typing import List, Dict, Optional, Tuple
+import sys
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from src.structured_store import StructuredStore
+
+
+class CutoffScoreIndex:
+    """
+    Index điểm chuẩn dựng 1 lần lúc load structured data, chỉ gồm vài mảng int (không có dict theo key).
+    - store: các dòng điểm dạng cột (StructuredStore), dòng chỉ được decode khi trả về
+    - _keys: 1 cột khóa (mã ngành << 16 | năm đảo) đã sắp, _major_order: vị trí dòng theo thứ tự đó
+      -> các dòng của 1 ngành / 1 (ngành, năm) là 1 đoạn liên tiếp, tìm bằng np.searchsorted, trong đoạn năm giảm dần
+    - _order: mọi dòng sắp năm giảm dần, dùng khi không có ngành
+    to_hop / method lọc trên đoạn tìm được bằng mask NumPy trên cột mã.
+    """
+    # năm lưu đảo (YEAR_MAX - year) trong 16 bit thấp của khóa để sắp tăng = năm giảm dần
+    YEAR_MAX = 0xFFFF
+
+    def __init__(self, store: StructuredStore):
+        self.store = store
+        # năm giảm dần, cùng năm giữ thứ tự gốc (giống sort stable cũ)
+        self._years = np.asarray(store.columns['year'], dtype=np.int32)
+        self._order = np.argsort(-self._years.astype(np.int64), kind='stable').astype(np.int32)
+        self._codes, self._vocab_index = {}, {}
+        for col in ('major_id', 'to_hop', 'method'):
+            self._codes[col], vocab = store.categorical(col)
+            self._vocab_index[col] = {value: i for i, value in enumerate(vocab)}
+        # mã ngành chỉ cần lúc dựng khóa
+        major_codes = self._codes.pop('major_id').astype(np.int64)
+        keys = self._key(major_codes, np.clip(self._years, 0, self.YEAR_MAX).astype(np.int64))
+        self._major_order = np.argsort(keys, kind='stable').astype(np.int32)
+        self._keys = keys[self._major_order]
+        self._sort_rank = np.empty(len(store), dtype=np.int64)
+        self._sort_rank[self._order] = np.arange(len(store))
+        # tên ngành (chữ thường) -> major_id, dùng khi câu hỏi chỉ có tên ngành
+        self._major_names: Dict[str, set] = {}
+        for major_id, major_name in store.major_pairs():
+            if major_name:
+                self._major_names.setdefault(major_name.lower(), set()).add(major_id)
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+    @classmethod
+    def build(cls, store: StructuredStore) -> "CutoffScoreIndex":
+        return cls(store)
+
+    def positions(self, major_id: Optional[str] = None, year: Optional[int] = None,
+                  to_hop: Optional[str] = None, method: Optional[str] = None) -> np.ndarray:
+        empty = np.empty(0, dtype=np.int32)
+        if year is not None and not 0 < year <= self.YEAR_MAX:
+            return empty
+        if major_id is not None:
+            code = self._vocab_index['major_id'].get(major_id)
+            if code is None:
+                return empty
+            if year is None:
+                start, end = self._key(code, self.YEAR_MAX), self._key(code + 1, self.YEAR_MAX)
+            else:
+                start = self._key(code, year)
+                end = start + 1
+            lo, hi = np.searchsorted(self._keys, [start, end])
+            positions = self._major_order[lo:hi]
+        else:
+            positions = self._order
+        mask = np.ones(len(positions), dtype=bool)
+        if year is not None and major_id is None:
+            mask &= self._years[positions] == year
+        for col, value in (('to_hop', to_hop), ('method', method)):
+            if value is not None:
+                mask &= self._codes[col][positions] == self._vocab_index[col].get(value, -2)
+        return positions[mask]
+
+    @classmethod
+    def _key(cls, major_code, year):
+        # khóa sắp xếp: mã ngành tăng dần, trong ngành năm giảm dần (dòng thiếu năm cuối đoạn)
+        return (major_code << 16) | (cls.YEAR_MAX - year)
+
+    def lookup(self, major_id: Optional[str] = None, year: Optional[int] = None, to_hop: Optional[str] = None,
+               method: Optional[str] = None, major_name: Optional[str] = None, limit: int = 10) -> Tuple[List[Dict], int]:
+        """
+        Trả về (tối đa limit dòng mới nhất, tổng số dòng khớp).
+        major_name chỉ dùng khi không có major_id: khớp chuỗi con trong tên ngành.
+        """
+        if major_id or not major_name:
+            positions = self.positions(major_id, year, to_hop, method)
+        else:
+            name = major_name.lower()
+            major_ids = sorted({m for full_name, ids in self._major_names.items() if name in full_name for m in ids})
+            parts = [self.positions(m, year, to_hop, method) for m in major_ids]
+            positions = np.concatenate(parts) if parts else np.empty(0, dtype=np.int32)
+            positions = positions[np.argsort(self._sort_rank[positions], kind='stable')]
+        return [self.store.record(i) for i in positions[:limit].tolist()], len(positions)
+
+
+class CutoffTable:
+    """
+    Bảng điểm chuẩn dạng cột (NumPy) để phân tích trên toàn bộ lịch sử điểm:
+    - eligibility: với điểm của thí sinh, ngành nào đủ điểm / sát điểm chuẩn
+    - trend: điểm chuẩn thay đổi qua các năm (chênh lệch năm sau - năm trước)
+    - school_summary: thống kê điểm chuẩn theo từng trường
+    Các cột chuỗi (major, school, method, to_hop) lưu mã int32 + vocab, -1 nếu thiếu.
+    """
+    CATEGORICAL = ("major_id", "school_id", "method", "to_hop")
+
+    def __init__(self, codes: Dict[str, np.ndarray], vocabs: Dict[str, List[str]],
+                 years: np.ndarray, scores: np.ndarray, major_names: Dict[str, str]):
+        self.codes = codes
+        self.vocabs = vocabs
+        self.years = years
+        self.scores = scores
+        self.major_names = major_names
+        self._vocab_index = {col: {value: i for i, value in enumerate(values)} for col, values in vocabs.items()}
+
+    def __len__(self) -> int:
+        return len(self.scores)
+
+    @classmethod
+    def build(cls, store: StructuredStore) -> "CutoffTable":
+        # bỏ dòng thiếu điểm chuẩn / năm; mã các cột phân loại lấy thẳng từ id chuỗi trong store
+        years = np.asarray(store.columns['year'])
+        scores = np.asarray(store.columns['cutoff_score'])
+        rows = np.flatnonzero((years > 0) & ~np.isnan(scores))
+        codes, vocabs = {}, {}
+        for col in cls.CATEGORICAL:
+            codes[col], vocabs[col] = store.categorical(col, rows)
+        return cls(
+            codes=codes,
+            vocabs=vocabs,
+            years=years[rows].astype(np.int32),
+            scores=scores[rows].astype(np.float32),
+            major_names=dict(store.major_pairs()),
+        )
+
+    # ============================================
+    # HELPERS
+    # ============================================
+    def _mask(self, **filters) -> np.ndarray:
+        # AND các điều kiện (cột phân loại hoặc year), bỏ qua điều kiện None
+        mask = np.ones(len(self), dtype=bool)
+        for col, value in filters.items():
+            if value is None:
+                continue
+            if col == 'year':
+                mask &= self.years == value
+            else:
+                mask &= self.codes[col] == self._vocab_index[col].get(value, -2)
+        return mask
+
+    def _value(self, col: str, code: int) -> Optional[str]:
+        return self.vocabs[col][code] if code >= 0 else None
+
+    def _row(self, i: int) -> Dict:
+        major_id = self._value('major_id', int(self.codes['major_id'][i]))
+        return {
+            'major_id': major_id,
+            'major_name': self.major_names.get(major_id, ''),
+            'school_id': self._value('school_id', int(self.codes['school_id'][i])),
+            'year': int(self.years[i]),
+            'method': self._value('method', int(self.codes['method'][i])),
+            'to_hop': self._value('to_hop', int(self.codes['to_hop'][i])),
+            'cutoff_score': round(float(self.scores[i]), 2),
+        }
+
+    def _group_keys(self, rows: np.ndarray) -> np.ndarray:
+        # 1 nhóm = (ngành, tổ hợp, phương thức)
+        major = self.codes['major_id'][rows].astype(np.int64) + 1
+        to_hop = self.codes['to_hop'][rows].astype(np.int64) + 1
+        method = self.codes['method'][rows].astype(np.int64) + 1
+        return (major * (len(self.vocabs['to_hop']) + 1) + to_hop) * (len(self.vocabs['method']) + 1) + method
+
+    def _latest_rows(self, rows: np.ndarray) -> np.ndarray:
+        # dòng năm mới nhất của mỗi nhóm (ngành, tổ hợp, phương thức)
+        if len(rows) == 0:
+            return rows
+        groups = self._group_keys(rows)
+        order = np.lexsort((-self.years[rows], groups))
+        _, first = np.unique(groups[order], return_index=True)
+        return rows[order[first]]
+
+    # ============================================
+    # ANALYTICS
+    # ============================================
+    def eligibility(self, score: float, to_hop: Optional[str] = None, method: Optional[str] = None,
+                    year: Optional[int] = None, major_id: Optional[str] = None,
+                    margin: float = 1.0, limit: int = 20) -> Dict:
+        """
+        So điểm thí sinh với điểm chuẩn (năm chỉ định hoặc năm gần nhất của từng ngành/tổ hợp/phương thức).
+        - eligible: điểm chuẩn <= điểm thí sinh, sắp theo điểm chuẩn giảm dần (ngành "vừa sức" nhất trước)
+        - borderline: điểm chuẩn cao hơn không quá margin điểm
+        """
+        rows = np.flatnonzero(self._mask(to_hop=to_hop, method=method, year=year, major_id=major_id))
+        rows = self._latest_rows(rows)
+        gaps = score - self.scores[rows]
+        eligible = rows[gaps >= 0]
+        borderline = rows[(gaps < 0) & (gaps >= -margin)]
+        eligible = eligible[np.argsort(-self.scores[eligible], kind='stable')]
+        borderline = borderline[np.argsort(self.scores[borderline], kind='stable')]
+
+        def with_gap(i):
+            row = self._row(i)
+            row['gap'] = round(score - row['cutoff_score'], 2)
+            return row
+
+        return {
+            'eligible': [with_gap(i) for i in eligible[:limit].tolist()],
+            'borderline': [with_gap(i) for i in borderline[:limit].tolist()],
+            'total_eligible': int(len(eligible)),
+            'total_borderline': int(len(borderline)),
+        }
+
+    def trend(self, major_id: Optional[str] = None, to_hop: Optional[str] = None,
+              method: Optional[str] = None, school_id: Optional[str] = None) -> List[Dict]:
+        """
+        Điểm chuẩn theo năm của từng (ngành, tổ hợp, phương thức) kèm chênh lệch so với năm trước.
+        """
+        rows = np.flatnonzero(self._mask(major_id=major_id, to_hop=to_hop, method=method, school_id=school_id))
+        if len(rows) == 0:
+            return []
+        groups = self._group_keys(rows)
+        order = np.lexsort((self.years[rows], groups))
+        rows, groups = rows[order], groups[order]
+        scores = self.scores[rows]
+        # chênh lệch với dòng trước nếu cùng nhóm
+        same_group = np.r_[False, groups[1:] == groups[:-1]]
+        deltas = np.r_[0.0, np.diff(scores)]
+
+        series, current = [], None
+        for pos, i in enumerate(rows.tolist()):
+            if not same_group[pos]:
+                row = self._row(i)
+                current = {key: row[key] for key in ('major_id', 'major_name', 'school_id', 'method', 'to_hop')}
+                current['history'] = []
+                series.append(current)
+            current['history'].append({
+                'year': int(self.years[i]),
+                'cutoff_score': round(float(scores[pos]), 2),
+                'delta': round(float(deltas[pos]), 2) if same_group[pos] else None,
+            })
+        for item in series:
+            history = item['history']
+            item['total_change'] = round(history[-1]['cutoff_score'] - history[0]['cutoff_score'], 2)
+        return series
+
+    def school_summary(self, year: Optional[int] = None, to_hop: Optional[str] = None,
+                       method: Optional[str] = None) -> List[Dict]:
+        """
+        Thống kê theo trường (mặc định năm gần nhất có dữ liệu): số ngành, điểm chuẩn thấp / cao / trung bình,
+        ngành có điểm chuẩn cao nhất.
+        """
+        if year is None and len(self):
+            year = int(self.years.max())
+        rows = np.flatnonzero(self._mask(year=year, to_hop=to_hop, method=method))
+        rows = rows[self.codes['school_id'][rows] >= 0]
+        if len(rows) == 0:
+            return []
+        n_schools = len(self.vocabs['school_id'])
+        schools = self.codes['school_id'][rows]
+        scores = self.scores[rows].astype(np.float64)
+        counts = np.bincount(schools, minlength=n_schools)
+        sums = np.bincount(schools, weights=scores, minlength=n_schools)
+        mins = np.full(n_schools, np.inf)
+        maxs = np.full(n_schools, -np.inf)
+        np.minimum.at(mins, schools, scores)
+        np.maximum.at(maxs, schools, scores)
+        # dòng có điểm cao nhất mỗi trường
+        order = np.lexsort((-scores, schools))
+        _, first = np.unique(schools[order], return_index=True)
+        top_rows = dict(zip(schools[order[first]].tolist(), rows[order[first]].tolist()))
+
+        summary = []
+        for code in np.flatnonzero(counts).tolist():
+            top = self._row(top_rows[code])
+            summary.append({
+                'school_id': self.vocabs['school_id'][code],
+                'year': year,
+                'num_entries': int(counts[code]),
+                'min_cutoff': round(float(mins[code]), 2),
+                'max_cutoff': round(float(maxs[code]), 2),
+                'mean_cutoff': round(float(sums[code] / counts[code]), 2),
+                'top_major': {'major_id': top['major_id'], 'major_name': top['major_name'],
+                              'to_hop': top['to_hop'], 'cutoff_score': top['cutoff_score']},
+            })
+        summary.sort(key=lambda item: item['mean_cutoff'], reverse=True)
+        return summary
+
+
+class TuitionIndex:
+    """
+    Index học phí dựng 1 lần từ hoc_phi.json:
+    - _by_major: major_id -> nhóm học phí (theo danh sách major_ids của nhóm)
+    - _by_school: school_id -> nhóm học phí, fallback khi ngành không có trong major_ids
+    Nhóm trả về ở dạng gọn (bỏ danh sách major_ids) để context gửi LLM nhỏ,
+    không xác định được nhóm thì chỉ trả tóm tắt mọi nhóm (bỏ details).
+    """
+    # group_id cũ -> school_id
+    GROUP_SCHOOL_ALIASES = {'CNTT': 'CS'}
+    COMPACT_FIELDS = ('group_id', 'group_name', 'estimated_per_year', 'details')
+    SUMMARY_FIELDS = ('group_id', 'group_name', 'estimated_per_year')
+
+    def __init__(self, tuition_data: Dict):
+        self.header = {
+            'university': tuition_data.get('university', ''),
+            'currency': tuition_data.get('currency', 'VND'),
+            'calculation_method': tuition_data.get('calculation_method', ''),
+        }
+        self.notes = tuition_data.get('notes', [])
+        self.groups = [self._compact(g) for g in tuition_data.get('tuition_groups', [])]
+        self.summaries = [self._compact(g, self.SUMMARY_FIELDS) for g in self.groups]
+        self._by_major: Dict[str, Dict] = {}
+        self._by_school: Dict[str, Dict] = {}
+        for group, compact in zip(tuition_data.get('tuition_groups', []), self.groups):
+            for major_id in group.get('major_ids', []):
+                self._by_major.setdefault(major_id, compact)
+            group_id = group.get('group_id', '')
+            self._by_school.setdefault(self.GROUP_SCHOOL_ALIASES.get(group_id, group_id), compact)
+
+    def __bool__(self) -> bool:
+        return bool(self.groups)
+
+    @classmethod
+    def build(cls, store: StructuredStore) -> "TuitionIndex":
+        return cls(store.section('hoc_phi') or {})
+
+    def _compact(self, group: Dict, fields: Tuple[str, ...] = COMPACT_FIELDS) -> Dict:
+        return {key: group[key] for key in fields if group.get(key)}
+
+    def lookup(self, major_id: Optional[str], school_id: Optional[str] = None) -> Tuple[Optional[Dict], Optional[str]]:
+        # (nhóm học phí, 'major' | 'school' | None)
+        if major_id in self._by_major:
+            return self._by_major[major_id], 'major'
+        if school_id in self._by_school:
+            return self._by_school[school_id], 'school'
+        return None, None
+
+    def record(self, major_info: Optional[Dict]) -> Dict:
+        """
+        Kết quả học phí gọn: có ngành -> chỉ nhóm của ngành (kèm details),
+        không có / không khớp -> tóm tắt mọi nhóm (group_name, estimated_per_year).
+        """
+        result = {**self.header, 'tuition_groups': self.summaries, 'notes': self.notes}
+        if major_info:
+            group, matched_by = self.lookup(major_info['major_id'], major_info.get('school_id'))
+            result['major'] = {
+                'major_id': major_info['major_id'],
+                'major_name': major_info.get('major_name', ''),
+                'matched_by': matched_by
+            }
+            if group:
+                result['tuition_groups'] = [group]
+        return result
+
+
+class SubjectCombinationIndex:
+    """
+    Index tổ hợp môn dựng 1 lần từ to_hop_mon.json:
+    - _by_code: mã tổ hợp -> tổ hợp, mọi mã trong câu hỏi được lấy bằng 1 regex (A00, D14, DD2...)
+    - _by_subject: môn -> các mã tổ hợp có môn đó ('tổ hợp nào có môn Văn?')
+    """
+    # cách gọi tắt của môn; bỏ các từ dễ trùng nghĩa khác như 'sử' (sử dụng), 'địa' (địa chỉ), 'sinh' (tuyển sinh), 'lý' (quản lý)
+    SUBJECT_ALIASES = {
+        'Toán': ['toán'],
+        'Ngữ văn': ['văn'],
+        'Hóa học': ['hóa', 'hoá', 'hoá học'],
+        'Tiếng Anh': ['anh văn'],
+        'Vẽ mỹ thuật': ['vẽ'],
+    }
+
+    def __init__(self, to_hop_data: Dict):
+        self.description = to_hop_data.get('description', '')
+        self._by_code: Dict[str, Dict] = {}
+        for combo in to_hop_data.get('combinations', []):
+            if combo.get('code'):
+                self._by_code.setdefault(combo['code'].upper(), combo)
+        self._by_subject: Dict[str, List[str]] = {}
+        for code, combo in self._by_code.items():
+            for subject in combo.get('subjects', []):
+                self._by_subject.setdefault(subject, []).append(code)
+
+        codes = sorted(self._by_code, key=len, reverse=True)
+        self._code_pattern = re.compile(rf'(?<!\w)({"|".join(map(re.escape, codes))})(?!\w)') if codes else None
+        self._subject_names: Dict[str, str] = {}
+        for subject in self._by_subject:
+            for name in [subject] + self.SUBJECT_ALIASES.get(subject, []):
+                self._subject_names.setdefault(unicodedata.normalize('NFC', name.lower()), subject)
+        names = sorted(self._subject_names, key=len, reverse=True)
+        self._subject_pattern = re.compile(rf'(?<!\w)({"|".join(map(re.escape, names))})(?!\w)') if names else None
+
+    def __bool__(self) -> bool:
+        return bool(self._by_code)
+
+    def __len__(self) -> int:
+        return len(self._by_code)
+
+    @classmethod
+    def build(cls, store: StructuredStore) -> "SubjectCombinationIndex":
+        return cls(store.section('to_hop') or {})
+
+    def get(self, code: str) -> Optional[Dict]:
+        return self._by_code.get(code.upper())
+
+    def codes_in(self, query: str) -> List[str]:
+        # mọi mã tổ hợp trong câu hỏi, theo thứ tự xuất hiện, không trùng
+        if self._code_pattern is None:
+            return []
+        return list(dict.fromkeys(self._code_pattern.findall(query.upper())))
+
+    def subjects_in(self, query: str) -> List[str]:
+        if self._subject_pattern is None:
+            return []
+        text = unicodedata.normalize('NFC', query.lower())
+        return list(dict.fromkeys(self._subject_names[m] for m in self._subject_pattern.findall(text)))
+
+    def codes_with_subjects(self, subjects: List[str]) -> List[str]:
+        # tổ hợp có đủ các môn; không có tổ hợp nào đủ -> tổ hợp có ít nhất 1 môn
+        code_sets = [set(self._by_subject.get(subject, [])) for subject in subjects]
+        if not code_sets:
+            return []
+        matched = set.intersection(*code_sets) or set.union(*code_sets)
+        return [code for code in self._by_code if code in matched]
+
+    def lookup(self, query: str) -> Dict:
+        """
+        Mã tổ hợp trong câu hỏi -> các tổ hợp đó; không có mã mà có tên môn -> tổ hợp chứa môn;
+        không có gì -> chỉ danh sách mã tổ hợp (không kèm môn).
+        """
+        codes = self.codes_in(query)
+        matched_by = 'code' if codes else None
+        if not codes:
+            codes = self.codes_with_subjects(self.subjects_in(query))
+            matched_by = 'subject' if codes else None
+        result = {'description': self.description, 'total': len(self._by_code), 'matched_by': matched_by}
+        if codes:
+            result['combinations'] = [self._by_code[code] for code in codes]
+        else:
+            result['codes'] = list(self._by_code)
+        return result
@@ -0,0 +1,191 @@
+import json
+import numpy as np
+from pathlib import Path
+from typing import List, Dict, Optional, Tuple
+
+STRUCTURED_STORE_DIR = "structured_store"
+STRUCTURED_STORE_META = "meta.json"
+
+
+class StructuredStore:
+    """
+    structured_data ở dạng nhị phân, load bằng memory-map (np.load mmap_mode='r'):
+    - strings_data / strings_offsets: mọi chuỗi intern 1 lần, lưu liền nhau (utf-8), decode khi truy cập
+    - cutoff_*: các dòng điểm chuẩn dạng cột, dòng i của mọi cột là 1 dòng điểm
+      (cột chuỗi lưu id chuỗi int32, -1 nếu thiếu; year int32, 0 nếu thiếu; cutoff_score float32, NaN nếu thiếu)
+    - sections: phần còn lại (to_hop, hoc_phi, admission_methods, header file diem_*) là chuỗi JSON trong bảng chuỗi,
+      chỉ parse khi được dùng
+    structured_data.json vẫn được ghi khi build để export / xem bằng tay.
+    """
+    # thứ tự field của 1 dòng điểm khi decode (giống file diem_*.json)
+    RECORD_FIELDS = ("major_id", "major_name", "year", "method", "to_hop", "cutoff_score", "analysis", "trend", "note")
+    NUMERIC_FIELDS = ("year", "cutoff_score")
+    STRING_FIELDS = ("major_id", "major_name", "method", "to_hop", "analysis", "trend", "note")
+    # cột ngoài record: school_id (của dòng hoặc của file), source (key file diem_*), extra (JSON các field khác)
+    STRING_COLUMNS = STRING_FIELDS + ("school_id", "source", "extra")
+
+    def __init__(self, strings_data: np.ndarray, strings_offsets: np.ndarray, columns: Dict[str, np.ndarray],
+                 sections: Dict[str, int], row_ranges: Dict[str, List[int]]):
+        self._strings_data = strings_data
+        self._strings_offsets = strings_offsets
+        self.columns = columns
+        self.sections = sections
+        self.row_ranges = row_ranges
+        self._section_cache: Dict[str, Dict] = {}
+
+    def __len__(self) -> int:
+        return len(self.columns['year'])
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.sections
+
+    @staticmethod
+    def is_cutoff_section(key: str, value) -> bool:
+        # cùng điều kiện nhận diện file điểm chuẩn như trước đây
+        return "diem_" in key and isinstance(value, dict) and "data" in value
+
+    # ============================================
+    # BUILD / SAVE / LOAD
+    # ============================================
+    @classmethod
+    def from_data(cls, structured_data: Dict) -> "StructuredStore":
+        strings, interned = [], {}
+
+        def intern(value: Optional[str]) -> int:
+            if value is None:
+                return -1
+            if value not in interned:
+                interned[value] = len(strings)
+                strings.append(value)
+            return interned[value]
+
+        ids = {col: [] for col in cls.STRING_COLUMNS}
+        years, scores = [], []
+        sections, row_ranges = {}, {}
+        for key, value in structured_data.items():
+            if not cls.is_cutoff_section(key, value):
+                sections[key] = intern(json.dumps(value, ensure_ascii=False, separators=(',', ':')))
+                continue
+            sections[key] = intern(json.dumps({k: v for k, v in value.items() if k != 'data'},
+                                              ensure_ascii=False, separators=(',', ':')))
+            start = len(years)
+            for row in value['data']:
+                extra = {k: v for k, v in row.items() if k not in cls.RECORD_FIELDS}
+                for field in cls.STRING_FIELDS:
+                    field_value = row.get(field)
+                    if field_value is not None and not isinstance(field_value, str):
+                        extra[field] = field_value
+                        field_value = None
+                    ids[field].append(intern(field_value))
+                year, score = row.get('year'), row.get('cutoff_score')
+                if year is not None and not isinstance(year, int):
+                    extra['year'], year = year, None
+                if score is not None and not isinstance(score, (int, float)):
+                    extra['cutoff_score'], score = score, None
+                years.append(year or 0)
+                scores.append(np.nan if score is None else score)
+                ids['school_id'].append(intern(row.get('school_id') or value.get('school_id')))
+                ids['source'].append(intern(key))
+                ids['extra'].append(intern(json.dumps(extra, ensure_ascii=False)) if extra else -1)
+            row_ranges[key] = [start, len(years)]
+
+        encoded = [s.encode('utf-8') for s in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(b) for b in encoded])
+        columns = {col: np.array(values, dtype=np.int32) for col, values in ids.items()}
+        columns['year'] = np.array(years, dtype=np.int32)
+        columns['cutoff_score'] = np.array(scores, dtype=np.float32)
+        return cls(np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets, columns, sections, row_ranges)
+
+    def save(self, folder_path) -> Path:
+        output = Path(folder_path) / STRUCTURED_STORE_DIR
+        output.mkdir(parents=True, exist_ok=True)
+        np.save(output / "strings_data.npy", self._strings_data)
+        np.save(output / "strings_offsets.npy", self._strings_offsets)
+        for col, values in self.columns.items():
+            np.save(output / f"cutoff_{col}.npy", values)
+        # meta ghi sau cùng: store chỉ hợp lệ khi đã có meta
+        meta = {'num_rows': len(self), 'columns': list(self.columns), 'sections': self.sections,
+                'row_ranges': self.row_ranges}
+        with open(output / STRUCTURED_STORE_META, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        return output
+
+    @classmethod
+    def load(cls, folder_path) -> Optional["StructuredStore"]:
+        path = Path(folder_path) / STRUCTURED_STORE_DIR
+        if not (path / STRUCTURED_STORE_META).exists():
+            return None
+        with open(path / STRUCTURED_STORE_META, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        columns = {col: np.load(path / f"cutoff_{col}.npy", mmap_mode='r') for col in meta['columns']}
+        return cls(
+            np.load(path / "strings_data.npy", mmap_mode='r'),
+            np.load(path / "strings_offsets.npy", mmap_mode='r'),
+            columns,
+            meta['sections'],
+            meta['row_ranges'],
+        )
+
+    # ============================================
+    # ACCESS
+    # ============================================
+    def string(self, string_id: int) -> Optional[str]:
+        if string_id < 0:
+            return None
+        start, end = int(self._strings_offsets[string_id]), int(self._strings_offsets[string_id + 1])
+        return bytes(self._strings_data[start:end]).decode('utf-8')
+
+    def record(self, row: int) -> Dict:
+        # decode 1 dòng điểm về dạng dict như trong file diem_*.json (field thiếu thì bỏ)
+        record = {}
+        for field in self.RECORD_FIELDS:
+            if field == 'year':
+                value = int(self.columns['year'][row]) or None
+            elif field == 'cutoff_score':
+                score = float(self.columns['cutoff_score'][row])
+                value = None if np.isnan(score) else round(score, 2)
+            else:
+                value = self.string(int(self.columns[field][row]))
+            if value is not None:
+                record[field] = value
+        extra = self.string(int(self.columns['extra'][row]))
+        if extra:
+            record.update(json.loads(extra))
+        return record
+
+    def section(self, key: str) -> Optional[Dict]:
+        # parse lần đầu truy cập; file diem_* được ghép lại 'data' từ các cột
+        if key not in self.sections:
+            return None
+        if key not in self._section_cache:
+            value = json.loads(self.string(self.sections[key]))
+            if key in self.row_ranges:
+                start, end = self.row_ranges[key]
+                value['data'] = [self.record(i) for i in range(start, end)]
+            self._section_cache[key] = value
+        return self._section_cache[key]
+
+    def to_data(self) -> Dict:
+        # dạng dict giống structured_data.json
+        return {key: self.section(key) for key in self.sections}
+
+    def categorical(self, col: str, rows: Optional[np.ndarray] = None) -> Tuple[np.ndarray, List[str]]:
+        """
+        Cột chuỗi -> (mã int32 theo vocab, vocab đã sắp xếp), -1 nếu thiếu / rỗng.
+        Chỉ decode các chuỗi khác nhau của cột, không decode từng dòng.
+        """
+        ids = np.asarray(self.columns[col] if rows is None else self.columns[col][rows])
+        unique_ids, inverse = np.unique(ids, return_inverse=True)
+        names = [self.string(int(i)) for i in unique_ids]
+        vocab = sorted({name for name in names if name})
+        position = {name: i for i, name in enumerate(vocab)}
+        lut = np.array([position.get(name, -1) for name in names], dtype=np.int32)
+        return lut[inverse.reshape(-1)] if len(ids) else np.empty(0, dtype=np.int32), vocab
+
+    def major_pairs(self) -> List[Tuple[str, str]]:
+        # các cặp (major_id, major_name) khác nhau trong bảng điểm
+        if not len(self):
+            return []
+        pairs = np.unique(np.stack([np.asarray(self.columns['major_id']), np.asarray(self.columns['major_name'])], axis=1), axis=0)
+        return [(self.string(int(m)), self.string(int(n)) or '') for m, n in pairs.tolist() if m >= 0]
@@ -1,6 +1,9 @@
 import re 
-from typing import List, Dict, Optional
-from langchain_core.documents import Document
+import unicodedata
+from typing import TYPE_CHECKING, List, Dict, Optional
+# chỉ dùng cho type hint: query_router / query_context import utils mà không kéo theo langchain
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
 
 def clean_text(text: str) -> str:
     text = re.sub(r'\s+', ' ', text)
@@ -8,7 +11,7 @@ def clean_text(text: str) -> str:
     return text.strip()
 
 
-def format_source(source:  List[Document]) -> str:
+def format_source(source:  List["Document"]) -> str:
     formatted_sources = []
     if not source:
         return "Không có nguồn tham khảo."
@@ -25,14 +28,60 @@ def format_source(source:  List[Document]) -> str:
         formatted_sources.append(f"Nguồn{i}. {header}\n   Nội dung: {content}...")
     return "\n\n".join(formatted_sources)
 
+def fold_accents(text: str) -> str:
+    """Bỏ dấu tiếng Việt: 'Điểm chuẩn' -> 'Diem chuan'"""
+    text = text.replace('đ', 'd').replace('Đ', 'D')
+    return ''.join(c for c in unicodedata.normalize('NFD', text) if unicodedata.category(c) != 'Mn')
+
+def tokenize(text: str) -> List[str]:
+    """Tách từ (chữ thường) kèm dạng bỏ dấu nếu khác dạng gốc"""
+    tokens = []
+    for token in re.findall(r'\w+', text.lower()):
+        tokens.append(token)
+        folded = fold_accents(token)
+        if folded != token:
+            tokens.append(folded)
+    return tokens
+
+def normalize_query(query: str) -> str:
+    """Chuẩn hóa câu hỏi làm khóa cache: 'Điểm chuẩn  AI, 2024?' -> 'điểm chuẩn ai 2024'
+    Giữ dấu vì router phân biệt dấu ('tiền' / 'tiến' là 2 loại câu hỏi khác nhau)"""
+    text = unicodedata.normalize('NFC', query.lower())
+    return ' '.join(re.findall(r'\w+', text))
+
 def truncate_text(text: str, max_length: int) -> str:
     if len(text) <= max_length:
         return text
     return text[:max_length].rsplit(' ', 1)[0] + '...'
 
+def extract_year(query: str) -> Optional[int]:
+    year_match = re.search(r'202[0-9]', query)
+    return int(year_match.group()) if year_match else None
+
+def extract_combo(query: str) -> Optional[str]:
+    combo_match = re.search(r'[A-Z]\d{2}', query.upper())
+    return combo_match.group() if combo_match else None
+
+def extract_user_score(query: str) -> Optional[float]:
+    """
+    Điểm thí sinh trong câu hỏi -> float (0-30), None nếu không có.
+    Chỉ nhận số đứng cạnh 'điểm' ('22 điểm', '22,5đ', 'điểm của em là 24') hoặc số thập phân sau 'được' / 'đạt'
+    ('được 24.25'); số trần như 'được 2 năm', 'top 10 ngành' không phải điểm.
+    """
+    text = fold_accents(query.lower())
+    number = r'(\d{1,2}(?:[.,]\d{1,2})?)(?![\d.,]*\d)'
+    decimal = r'(\d{1,2}[.,]\d{1,2})(?![\d.,]*\d)'
+    match = (re.search(rf'(?<![\d.,]){number}\s*(?:diem|d)(?!\w)', text)
+             or re.search(rf'\bdiem\s+(?:(?:cua\s+)?(?:em|minh|toi|thi)\s+)?(?:la|duoc|dat)\s+{number}', text)
+             or re.search(rf'\bdiem\s+(?:cua\s+)?(?:em|minh|toi|thi)\s+{number}', text)
+             or re.search(rf'\b(?:duoc|dat)\s+{decimal}', text))
+    if not match:
+        return None
+    score = float(match.group(1).replace(',', '.'))
+    return score if 0 < score <= 30 else None
+
 def parse_score_query(query: str) -> Dict:
     """Parse câu hỏi về điểm chuẩn"""
-    query_lower = query.lower().strip()
     result = {
         'major_id': None,
         'major_name': None,
@@ -43,35 +92,59 @@ def parse_score_query(query: str) -> Dict:
     }
     
     # Extract year
-    year_match = re.search(r'202[0-9]', query)
-    if year_match:
-        result['year'] = int(year_match.group())
+    result['year'] = extract_year(query)
     
     # Extract subject combo
-    combo_match = re.search(r'[A-Z]\d{2}', query.upper())
-    if combo_match:
-        result['to_hop'] = combo_match.group()
+    result['to_hop'] = extract_combo(query)
     
-    for major_id, info in MAJOR_MAPPING.items():
-        variants = info['variants']
-        if any(variant in query_lower for variant in variants):
-                result['major_id'] = major_id
-                result['major_name'] = info['name']
-                result['school_id'] = info['school_id']
-                result['variants'] = info['variants']
-                break
+    major_info = extract_major_from_query(query)
+    if major_info:
+        result['major_id'] = major_info['major_id']
+        result['major_name'] = major_info['major_name']
+        result['school_id'] = major_info['school_id']
+        result['variants'] = major_info['variants']
     return result
+
+def find_majors_in_query(query: str) -> List[Dict]:
+    """
+    Tìm tất cả ngành nhắc tới trong query bằng 1 lần quét regex đã compile sẵn từ MAJOR_MAPPING.
+    - Khớp theo ranh giới từ ('ai' không khớp trong 'tài', 'y' không khớp trong 'quy')
+    - Tại mỗi vị trí lấy variant dài nhất ('luật kinh tế' -> LANG_ECON_LAW, không phải LANG_LAW)
+    Trả về theo thứ tự xuất hiện: [{'major_id', 'variant', 'span'}] (span trên query đã chuẩn hoá NFC, chữ thường)
+    """
+    matches = []
+    for m in _MAJOR_PATTERN.finditer(unicodedata.normalize('NFC', query.lower())):
+        matches.append({
+            'major_id': _VARIANT_TO_MAJOR[m.group()],
+            'variant': m.group(),
+            'span': m.span()
+        })
+    return matches
+
 def extract_major_from_query(query: str) -> Optional[Dict]:
-    query_lower = query.lower()
-    for major_id, info in MAJOR_MAPPING.items():
-        if any(v in query_lower for v in info["variants"]):
-            return {
-                "major_id": major_id,
-                "variants": info["variants"],
-                "school_id": info["school_id"],
-                "major_name": info["name"]
-            }
-    return None
+    # ngành nhắc tới đầu tiên trong query
+    matches = find_majors_in_query(query)
+    if not matches:
+        return None
+    major_id = matches[0]['major_id']
+    info = MAJOR_MAPPING[major_id]
+    return {
+        "major_id": major_id,
+        "variants": info["variants"],
+        "school_id": info["school_id"],
+        "major_name": info["name"]
+    }
+
+def _build_major_matcher(mapping: Dict):
+    # variant (và mã ngành của Bộ) -> major_id, ngành khai báo trước được ưu tiên khi trùng variant
+    variant_to_major = {}
+    for major_id, info in mapping.items():
+        for variant in info['variants'] + [info.get('ministry_code', '')]:
+            if variant:
+                variant_to_major.setdefault(variant.lower(), major_id)
+    alternation = '|'.join(re.escape(v) for v in sorted(variant_to_major, key=len, reverse=True))
+    return re.compile(rf'(?<!\w)(?:{alternation})(?!\w)'), variant_to_major
+
 MAJOR_MAPPING = {
     # ========================================
     # 1️⃣ TRƯỜNG KHOA HỌC MÁY TÍNH (CS)
@@ -784,6 +857,8 @@ MAJOR_MAPPING = {
         ]
     },
 }
+_MAJOR_PATTERN, _VARIANT_TO_MAJOR = _build_major_matcher(MAJOR_MAPPING)
+
 # Test
 if __name__ == "__main__":
     print("Testing utils...")
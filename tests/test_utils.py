@@ -0,0 +1,33 @@
+import sys
+from pathlib import Path
+import pytest
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+from src.utils import extract_user_score
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("22 điểm có đỗ ngành AI không?", 22.0),
+    ("Em được 22,5đ thì đậu ngành nào?", 22.5),
+    ("em thi được 24 điểm khối A00", 24.0),
+    ("Được 24.25 thì vào ngành nào?", 24.25),
+    ("Điểm của em là 24, có đỗ không?", 24.0),
+    ("điểm thi 23.5 đậu ngành nào", 23.5),
+])
+def test_extract_user_score(query, expected):
+    assert extract_user_score(query) == expected
+
+
+@pytest.mark.parametrize("query", [
+    "Học được 2 năm rồi chuyển ngành được không?",
+    "được 2 năm",
+    "Top 10 ngành có điểm chuẩn cao nhất",
+    "Điểm chuẩn 3 năm gần đây của ngành AI",
+    "Điểm chuẩn ngành AI năm 2024",
+    "Ngành AI học 4 năm",
+    "Đạt 2 giải học sinh giỏi có được ưu tiên không?",
+    "Học phí 22 đồng một tín chỉ?",
+    "Tổ hợp A00 gồm những môn nào?",
+    "35 điểm",
+])
+def test_extract_user_score_ignores_non_score_numbers(query):
+    assert extract_user_score(query) is None